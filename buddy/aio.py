@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import threading
+
+from buddy.client import MAX_POOL_CONNECTIONS
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_DONE = object()
+
+
+def get_executor():
+    """Return the thread pool shared by the async clients.
+
+    It is as large as the connection pools of the clients.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_POOL_CONNECTIONS)
+        return _executor
+
+
+def run(coroutine):
+    """Run a coroutine on a new event loop (asyncio.run before 3.7)."""
+    import asyncio
+    loop = asyncio.new_event_loop()
+    # Before 3.5.3, get_event_loop() inside a coroutine ignores the running loop
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+class AsyncIterator(object):
+    """Iterate over a blocking iterator (e.g. a paginator) from a loop."""
+
+    def __init__(self, iterator, executor):
+        self.iterator = iterator
+        self.executor = executor
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        import asyncio
+        loop = asyncio.get_event_loop()
+        item = await loop.run_in_executor(
+            self.executor, next, self.iterator, _DONE)
+        if item is _DONE:
+            raise StopAsyncIteration
+        return item
+
+
+async def collect(async_iterator):
+    items = []
+    async for item in async_iterator:
+        items.append(item)
+    return items
+
+
+class AsyncCall(object):
+    """A call run in the executor, awaited or iterated.
+
+    Awaiting it returns the result of the call. Iterating over it with
+    `async for` iterates over the result, pulling every item (e.g. every
+    page of a paginator) in the executor.
+    """
+
+    def __init__(self, call, executor):
+        self.call = call
+        self.executor = executor
+        self._iterator = None
+
+    async def _run(self):
+        import asyncio
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self.call)
+
+    def __await__(self):
+        return self._run().__await__()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._iterator is None:
+            result = await self._run()
+            self._iterator = AsyncIterator(iter(result), self.executor)
+        return await self._iterator.__anext__()
+
+
+class AsyncClient(object):
+    """Give a CfnClient or EcsClient a coroutine interface.
+
+    Methods return awaitables running the calls in the shared executor, so
+    independent calls can run concurrently on one event loop. Use `async
+    for` on methods returning iterators to get their results page by page.
+    """
+
+    def __init__(self, client, executor=None):
+        self.client = client
+        self.executor = executor or get_executor()
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            return AsyncCall(functools.partial(attr, *args, **kwargs),
+                             self.executor)
+        return call
@@ -0,0 +1,151 @@
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def cache_dir(*parts):
+    base = os.environ.get('BUDDY_CACHE_DIR')
+    if not base:
+        xdg = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        base = os.path.join(xdg, 'buddy')
+    return os.path.join(base, *parts)
+
+
+class FileCache(object):
+    """Small JSON store on disk, one file per key, least recently used
+    entries are evicted above `max_entries`."""
+
+    def __init__(self, name, max_entries=1000):
+        self.path = cache_dir(name)
+        self.max_entries = max_entries
+
+    def _file(self, key):
+        return os.path.join(self.path, '%s.json' % key)
+
+    def get(self, key):
+        path = self._file(key)
+        try:
+            with open(path) as fp:
+                value = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(value, fp, default=str)
+            os.replace(tmp, self._file(key))
+            self.evict()
+        except (IOError, OSError):
+            pass  # The cache is an optimization, never fail because of it
+
+    def evict(self):
+        entries = [
+            os.path.join(self.path, name) for name in os.listdir(self.path)
+            if name.endswith('.json')
+        ]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.timestamp()}
+    raise TypeError('Not JSON serializable: %r' % value)
+
+
+def _decode(mapping):
+    if '__datetime__' in mapping:
+        return datetime.datetime.fromtimestamp(mapping['__datetime__'],
+                                               datetime.timezone.utc)
+    return mapping
+
+
+class StateCache(object):
+    """Recent AWS state (stacks, services...) in a SQLite database.
+
+    Entries are grouped by kind, each kind expiring after its TTL. With
+    `fresh`, entries are not read but still written.
+    """
+
+    TTLS = {
+        'stack-list': 30,
+        'stack': 30,
+        'stack-resources': 60,
+        'service': 15,
+        'task-definition': 24 * 3600,  # immutable until deregistered
+    }
+
+    def __init__(self, path=None, ttls=None, fresh=False, clock=time.time):
+        self.path = path or cache_dir('state.sqlite')
+        self.ttls = dict(self.TTLS, **(ttls or {}))
+        self.fresh = fresh
+        self.clock = clock
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _execute(self, query, args=()):
+        import sqlite3
+        with self._lock:
+            try:
+                if self._db is None:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    self._db = sqlite3.connect(
+                        self.path, timeout=5, isolation_level=None,
+                        check_same_thread=False)
+                    self._db.execute(
+                        'CREATE TABLE IF NOT EXISTS state (kind TEXT, '
+                        'key TEXT, stored REAL, value TEXT, '
+                        'PRIMARY KEY (kind, key))')
+                return self._db.execute(query, args).fetchall()
+            except (sqlite3.Error, OSError):
+                return []  # The cache is an optimization, never fail
+
+    def get(self, kind, key):
+        if self.fresh:
+            return None
+        rows = self._execute(
+            'SELECT stored, value FROM state WHERE kind = ? AND key = ?',
+            (kind, key))
+        if not rows or self.clock() - rows[0][0] > self.ttls.get(kind, 0):
+            return None
+        return json.loads(rows[0][1], object_hook=_decode)
+
+    def set(self, kind, key, value):
+        self._execute(
+            'INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)',
+            (kind, key, self.clock(), json.dumps(value, default=_encode)))
+
+    def invalidate(self, kind, key=None):
+        if key is None:
+            self._execute('DELETE FROM state WHERE kind = ?', (kind,))
+        else:
+            self._execute('DELETE FROM state WHERE kind = ? AND key = ?',
+                          (kind, key))
+
+
+def state_cache_enabled():
+    return os.environ.get('BUDDY_STATE_CACHE', '').lower() in (
+        '1', 'true', 'yes')
+
+
+def get_state_cache(fresh=False):
+    """Return a StateCache if enabled with $BUDDY_STATE_CACHE, or None."""
+    if state_cache_enabled():
+        return StateCache(fresh=fresh)
@@ -1,14 +1,251 @@
-import boto3
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+import hashlib
+import os
+import threading
+
+from buddy import trace
+from buddy.cache import get_state_cache
+from buddy.ratelimit import ApiThrottle
+
+# boto3 takes a while to import, it is only imported when a client is needed
+
+MAX_POOL_CONNECTIONS = 32
+
+_registry_lock = threading.RLock()
+_sessions = {}
+_clients = {}
+_throttle = None
+
+# Calls per second, per API operation (BUDDY_API_RATE overrides them)
+API_RATES = {
+    'cloudformation': 5.0,
+    'ecs': 20.0,
+}
+RETRY_BUDGET = 100
+
+
+def chunked(sequence, size):
+    sequence = list(sequence)
+    return [sequence[i:i + size] for i in range(0, len(sequence), size)]
+
+
+def _unique(sequence):
+    seen = set()
+    return [e for e in sequence if not (e in seen or seen.add(e))]
+
+
+def _reached_cursor(event, since):
+    if since is None:
+        return False
+    if isinstance(since, str):
+        return event['EventId'] == since
+    return event['Timestamp'] <= since
+
+
+def _session_key(session_args):
+    return tuple(sorted(session_args.items()))
+
+
+def get_session(**session_args):
+    """Return the boto3 session shared by the process for these arguments."""
+    key = _session_key(session_args)
+    with _registry_lock:
+        if key not in _sessions:
+            import boto3.session
+            _sessions[key] = boto3.session.Session(**session_args)
+        return _sessions[key]
+
+
+def get_throttle():
+    """Return the rate limiter shared by all the clients."""
+    global _throttle
+    with _registry_lock:
+        if _throttle is None:
+            rate = os.environ.get('BUDDY_API_RATE')
+            budget = os.environ.get('BUDDY_RETRY_BUDGET', RETRY_BUDGET)
+            _throttle = ApiThrottle(
+                rates={} if rate else API_RATES,
+                default_rate=float(rate or 20.0),
+                retry_budget=int(budget),
+            )
+        return _throttle
+
+
+def get_client(service_name, **session_args):
+    """Return the shared (thread-safe) boto3 client of a service.
+
+    Clients are created on first use, with a connection pool sized for
+    concurrent calls, rate limited by the shared throttle and traced.
+    """
+    key = (service_name,) + _session_key(session_args)
+    with _registry_lock:
+        if key not in _clients:
+            import botocore.config
+            config = botocore.config.Config(
+                max_pool_connections=MAX_POOL_CONNECTIONS)
+            session = get_session(**session_args)
+            client = session.client(service_name, config=config)
+            get_throttle().install(client)
+            trace.install(client)
+            _clients[key] = client
+        return _clients[key]
+
+
+def reset_clients():
+    global _throttle
+    with _registry_lock:
+        _throttle = None
+        _sessions.clear()
+        _clients.clear()
 
 
 def get_aws_region_name(**session_args):
-    return boto3.session.Session(**session_args).region_name
+    region_name = (
+        session_args.get('region_name') or
+        (not session_args and os.environ.get('AWS_DEFAULT_REGION'))
+    )
+    return region_name or get_session(**session_args).region_name
+
+
+class BaseClient(object):
+    """Base of the clients.
+
+    With a `state_cache` (see buddy.cache.StateCache), the state read by
+    some calls is cached, per profile and region. Changes made through any
+    client invalidate it.
+    """
+
+    SERVICE_NAME = None
+
+    def __init__(self, state_cache=None, **session_args):
+        self.session_args = session_args
+        self.state_cache = state_cache
+
+    @property
+    def session(self):
+        return get_session(**self.session_args)
+
+    @property
+    def boto(self):
+        if not hasattr(self, '_boto'):
+            self._boto = self.client(self.SERVICE_NAME)
+        return self._boto
+
+    @property
+    def throttle(self):
+        return get_throttle()
+
+    def client(self, service_name):
+        return get_client(service_name, **self.session_args)
+
+    def _state_key(self, key):
+        """Scope a state cache key to the profile and region of the client."""
+        if not hasattr(self, '_state_scope'):
+            profile = (
+                self.session_args.get('profile_name') or
+                os.environ.get('AWS_PROFILE') or
+                os.environ.get('AWS_DEFAULT_PROFILE') or 'default'
+            )
+            self._state_scope = '%s/%s' % (
+                profile, get_aws_region_name(**self.session_args))
+        return '%s %s' % (self._state_scope, key)
+
+    def _cached(self, kind, key, fetch):
+        if self.state_cache is None:
+            return fetch()
+        key = self._state_key(key)
+        value = self.state_cache.get(kind, key)
+        if value is None:
+            value = fetch()
+            self.state_cache.set(kind, key, value)
+        return value
+
+    def _cached_iter(self, kind, key, iterator):
+        """Yield from the cache, or from iterator, caching what it yields
+        once it is exhausted."""
+        if self.state_cache is not None:
+            key = self._state_key(key)
+        cached = self.state_cache and self.state_cache.get(kind, key)
+        if cached is not None:
+            for item in cached:
+                yield item
+            return
+        items = []
+        for item in iterator:
+            if self.state_cache is not None:
+                items.append(item)
+            yield item
+        if self.state_cache is not None:
+            self.state_cache.set(kind, key, items)
+
+    def _invalidate(self, *entries):
+        """Forget the (kind, key) entries, key None for the whole kind."""
+        if not hasattr(self, '_shared_state_cache'):
+            # The cache of other processes, opened once per client
+            shared = get_state_cache()
+            if shared is not None and self.state_cache is not None and (
+                    shared.path == self.state_cache.path):
+                shared = None
+            self._shared_state_cache = shared
+        for cache in [self.state_cache, self._shared_state_cache]:
+            if cache is not None:
+                for kind, key in entries:
+                    cache.invalidate(
+                        kind, None if key is None else self._state_key(key))
+
+
+class CfnClient(BaseClient):
+    SERVICE_NAME = u'cloudformation'
+    TEMPLATE_BODY_LIMIT = 51200
+
+    def __init__(self, template_bucket=None, template_prefix='buddy/',
+                 template_url_threshold=TEMPLATE_BODY_LIMIT, state_cache=None,
+                 **session_args):
+        super(CfnClient, self).__init__(state_cache, **session_args)
+        if template_bucket is None:
+            template_bucket = os.environ.get('BUDDY_TEMPLATE_BUCKET')
+        self.template_bucket = template_bucket
+        self.template_prefix = template_prefix
+        self.template_url_threshold = template_url_threshold
+        self._template_urls = {}
+        self._upload_locks = {}
+        self._lock = threading.Lock()
+
+    def _template_args(self, template):
+        size = len(template.encode('utf-8'))
+        if self.template_bucket and size > self.template_url_threshold:
+            return {'TemplateURL': self.upload_template(template)}
+        return {'TemplateBody': template}
+
+    def upload_template(self, template):
+        """Store the template in S3 under its hash, return its URL.
+
+        Nothing is uploaded when the object already exists.
+        """
+        body = template.encode('utf-8')
+        key = '%s%s.template' % (self.template_prefix,
+                                 hashlib.sha256(body).hexdigest())
+        # One upload per template, different templates upload concurrently
+        with self._lock:
+            key_lock = self._upload_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key in self._template_urls:
+                return self._template_urls[key]
 
+            import botocore.exceptions
+            s3 = self.client(u's3')
+            try:
+                s3.head_object(Bucket=self.template_bucket, Key=key)
+            except botocore.exceptions.ClientError as err:
+                if err.response['Error']['Code'] not in ('404', 'NotFound'):
+                    raise
+                s3.put_object(Bucket=self.template_bucket, Key=key, Body=body)
 
-class CfnClient(object):
-    def __init__(self, **session_args):
-        session = boto3.session.Session(**session_args)
-        self.boto = session.client(u'cloudformation')
+            url = 'https://%s.s3.%s.amazonaws.com/%s' % (
+                self.template_bucket, s3.meta.region_name, key)
+            self._template_urls[key] = url
+            return url
 
     def _format_parameters(self, params):
         def one(key, value):
@@ -20,29 +257,74 @@ class CfnClient(object):
             return p
         return [one(key, value) for key, value in params.items()]
 
+    def _stack_changed(self, name):
+        self._invalidate(('stack-list', None), ('stack', name),
+                         ('stack-resources', name))
+
     def create_stack(self, name, template, parameters, capabilities):
         parameters = self._format_parameters(parameters)
-        return self.boto.create_stack(
+        response = self.boto.create_stack(
             StackName=name,
-            TemplateBody=template,
             Parameters=parameters,
             Capabilities=capabilities,
+            **self._template_args(template)
         )
+        self._stack_changed(name)
+        return response
 
     def update_stack(self, name, template, parameters, capabilities):
         parameters = self._format_parameters(parameters)
-        return self.boto.update_stack(
+        response = self.boto.update_stack(
             StackName=name,
-            TemplateBody=template,
             Parameters=parameters,
             Capabilities=capabilities,
+            **self._template_args(template)
         )
+        self._stack_changed(name)
+        return response
+
+    def get_template(self, name):
+        return self.boto.get_template(StackName=name)['TemplateBody']
+
+    def create_change_set(self, name, change_set_name, template, parameters,
+                          capabilities):
+        parameters = self._format_parameters(parameters)
+        return self.boto.create_change_set(
+            StackName=name,
+            ChangeSetName=change_set_name,
+            Parameters=parameters,
+            Capabilities=capabilities,
+            **self._template_args(template)
+        )
+
+    def describe_change_set(self, name, change_set_name):
+        args = {'StackName': name, 'ChangeSetName': change_set_name}
+        response = self.boto.describe_change_set(**args)
+        changes = response.get('Changes', [])
+        while response.get('NextToken'):
+            response = self.boto.describe_change_set(
+                NextToken=response['NextToken'], **args)
+            changes.extend(response.get('Changes', []))
+        response['Changes'] = changes
+        return response
+
+    def execute_change_set(self, name, change_set_name):
+        response = self.boto.execute_change_set(
+            StackName=name, ChangeSetName=change_set_name)
+        self._stack_changed(name)
+        return response
+
+    def delete_change_set(self, name, change_set_name):
+        return self.boto.delete_change_set(
+            StackName=name, ChangeSetName=change_set_name)
 
     def delete_stack(self, name, retain_resources):
         opts = {}
         if retain_resources:
             opts['RetainResources'] = retain_resources
-        return self.boto.delete_stack(StackName=name, **opts)
+        response = self.boto.delete_stack(StackName=name, **opts)
+        self._stack_changed(name)
+        return response
 
     STACK_STATUS_ACTIVE = [
         'CREATE_IN_PROGRESS',
@@ -62,72 +344,256 @@ class CfnClient(object):
         'UPDATE_ROLLBACK_COMPLETE',
     ]
 
+    STACK_STATUS_TERMINAL = [
+        s for s in STACK_STATUS_ACTIVE if not s.endswith('_IN_PROGRESS')
+    ] + ['DELETE_COMPLETE']
+
     def list_stacks(self, status_filter):
+        for summary in self._cached_iter('stack-list', ','.join(status_filter),
+                                         self._list_stacks(status_filter)):
+            yield summary
+
+    def _list_stacks(self, status_filter):
         paginator = self.boto.get_paginator('list_stacks')
-        pages = paginator.paginate(StackStatusFilter=status_filter)
-        return [e for p in pages for e in p['StackSummaries']]
+        for page in paginator.paginate(StackStatusFilter=status_filter):
+            for summary in page['StackSummaries']:
+                yield summary
+
+    def describe_stacks(self):
+        """Yield the descriptions (with tags and outputs) of all the
+        stacks, except the deleted ones, fetching pages lazily."""
+        paginator = self.boto.get_paginator('describe_stacks')
+        for page in paginator.paginate():
+            for stack in page['Stacks']:
+                yield stack
+
+    def list_exports(self):
+        paginator = self.boto.get_paginator('list_exports')
+        for page in paginator.paginate():
+            for export in page['Exports']:
+                yield export
 
     def describe_stack(self, name):
-        return self.boto.describe_stacks(StackName=name)['Stacks'][0]
+        return self._cached('stack', name, lambda: self.boto.describe_stacks(
+            StackName=name)['Stacks'][0])
 
-    def describe_stack_events(self, name):
+    def iter_stack_events(self, name, since=None):
+        """Yield the stack events, newest first, fetching pages lazily.
+
+        Stop before the `since` cursor: an EventId or a datetime.
+        """
         paginator = self.boto.get_paginator('describe_stack_events')
-        pages = paginator.paginate(StackName=name)
-        return [e for p in pages for e in p['StackEvents']]
+        for page in paginator.paginate(StackName=name):
+            for event in page['StackEvents']:
+                if _reached_cursor(event, since):
+                    return
+                yield event
+
+    def describe_stack_events(self, name):
+        return list(self.iter_stack_events(name))
 
     def list_stack_resources(self, name):
+        for summary in self._cached_iter('stack-resources', name,
+                                         self._list_stack_resources(name)):
+            yield summary
+
+    def _list_stack_resources(self, name):
         paginator = self.boto.get_paginator('list_stack_resources')
-        pages = paginator.paginate(StackName=name)
-        return [e for p in pages for e in p['StackResourceSummaries']]
+        for page in paginator.paginate(StackName=name):
+            for summary in page['StackResourceSummaries']:
+                yield summary
 
     def validate_template(self, template_body):
-        return self.boto.validate_template(TemplateBody=template_body)
+        return self.boto.validate_template(
+            **self._template_args(template_body))
+
 
+class EcsClient(BaseClient):
+    SERVICE_NAME = u'ecs'
+    MAX_SERVICES_PER_CALL = 10
+    MAX_TASKS_PER_CALL = 100
+    MAX_RUN_TASK_COUNT = 10
 
-class EcsClient(object):
-    def __init__(self, **session_args):
-        self.session = boto3.session.Session(**session_args)
-        self.boto = self.session.client(u'ecs')
+    def __init__(self, max_workers=8, state_cache=None, **session_args):
+        super(EcsClient, self).__init__(state_cache, **session_args)
+        self.max_workers = max_workers
+
+    def _run_batches(self, fn, batches):
+        if len(batches) < 2:
+            return [fn(*b) for b in batches]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(lambda b: fn(*b), batches))
+
+    def _batches(self, pairs, size):
+        pairs = sorted(_unique(pairs))
+        return [
+            (cluster, chunk)
+            for cluster, group in groupby(pairs, key=lambda p: p[0])
+            for chunk in chunked([p[1] for p in group], size)
+        ]
+
+    def describe_services_batch(self, services):
+        """Describe (cluster, service name) pairs in as few calls as possible.
+
+        Return a dict keyed by (cluster, service name). Missing services
+        are left out.
+        """
+        result = {}
+        if self.state_cache is not None:
+            for pair in _unique(services):
+                service = self.state_cache.get(
+                    'service', self._state_key('/'.join(pair)))
+                if service is not None:
+                    result[pair] = service
+            services = [p for p in services if p not in result]
+        batches = self._batches(services, self.MAX_SERVICES_PER_CALL)
+
+        def describe(cluster, names):
+            response = self.boto.describe_services(
+                cluster=cluster, services=names)
+            found = {}
+            for service in response['services']:
+                found[service['serviceName']] = service
+                found[service['serviceArn']] = service
+            return {(cluster, n): found[n] for n in names if n in found}
+
+        for found in self._run_batches(describe, batches):
+            result.update(found)
+            if self.state_cache is not None:
+                for pair, service in found.items():
+                    self.state_cache.set(
+                        'service', self._state_key('/'.join(pair)), service)
+        return result
+
+    def describe_tasks_batch(self, tasks):
+        """Describe (cluster, task arn) pairs, return a dict keyed by arn."""
+        batches = self._batches(tasks, self.MAX_TASKS_PER_CALL)
+
+        def describe(cluster, arns):
+            response = self.boto.describe_tasks(cluster=cluster, tasks=arns)
+            return response['tasks']
+
+        return {
+            task['taskArn']: task
+            for found in self._run_batches(describe, batches)
+            for task in found
+        }
 
     def describe_services(self, cluster_name, service_name):
         return self.boto.describe_services(
             cluster=cluster_name, services=[service_name])
 
-    def describe_task_definition(self, task_definition_arn):
-        return self.boto.describe_task_definition(
-            taskDefinition=task_definition_arn)
+    def describe_task_definition(self, task_definition_arn,
+                                 include_tags=False):
+        args = {'include': ['TAGS']} if include_tags else {}
 
-    def list_tasks(self, cluster_name, service_name):
+        def describe():
+            return self.boto.describe_task_definition(
+                taskDefinition=task_definition_arn, **args)
+
+        # Only revisions (full ARNs) are immutable, not families
+        if not task_definition_arn.startswith('arn:'):
+            return describe()
+        key = '%s tags' % task_definition_arn if include_tags else (
+            task_definition_arn)
+        return self._cached('task-definition', key, describe)
+
+    def list_services(self, cluster_name):
+        paginator = self.boto.get_paginator('list_services')
+        for page in paginator.paginate(cluster=cluster_name):
+            for arn in page['serviceArns']:
+                yield arn
+
+    def list_task_definitions(self, family, status='ACTIVE'):
+        """Yield the task definition arns of a family, newest first."""
+        paginator = self.boto.get_paginator('list_task_definitions')
+        pages = paginator.paginate(familyPrefix=family, status=status,
+                                   sort='DESC')
+        for page in pages:
+            for arn in page['taskDefinitionArns']:
+                # familyPrefix also matches longer family names
+                if arn.rsplit('/', 1)[-1].rsplit(':', 1)[0] == family:
+                    yield arn
+
+    def list_tasks(self, cluster_name, service_name, desired_status=None):
+        args = {'desiredStatus': desired_status} if desired_status else {}
         return self.boto.list_tasks(
-            cluster=cluster_name, serviceName=service_name)
+            cluster=cluster_name, serviceName=service_name, **args)
+
+    def list_task_arns(self, cluster_name, service_name,
+                       desired_status=None):
+        """Yield the task arns of a service, from all the pages."""
+        args = {'desiredStatus': desired_status} if desired_status else {}
+        paginator = self.boto.get_paginator('list_tasks')
+        pages = paginator.paginate(
+            cluster=cluster_name, serviceName=service_name, **args)
+        for page in pages:
+            for arn in page['taskArns']:
+                yield arn
 
     def describe_tasks(self, cluster_name, task_arns):
         return self.boto.describe_tasks(
             cluster=cluster_name, tasks=task_arns)
 
-    def register_task_definition(self, family, containers, volumes=None):
+    def register_task_definition(self, family, containers, volumes=None,
+                                 tags=None):
         args = {}
         if volumes:
             args['volumes'] = volumes
+        if tags:
+            args['tags'] = [{'key': k, 'value': v} for k, v in tags.items()]
         return self.boto.register_task_definition(
             family=family, containerDefinitions=containers, **args)
 
     def deregister_task_definition(self, task_definition_arn):
-        return self.boto.deregister_task_definition(
+        response = self.boto.deregister_task_definition(
             taskDefinition=task_definition_arn)
+        self._invalidate(
+            ('task-definition', task_definition_arn),
+            ('task-definition', '%s tags' % task_definition_arn))
+        return response
 
     def update_service(self, cluster, service, task_definition):
-        return self.boto.update_service(
+        response = self.boto.update_service(
             cluster=cluster,
             service=service,
             taskDefinition=task_definition,
         )
+        self._invalidate(('service', '%s/%s' % (cluster, service)))
+        return response
 
-    def run_task(self, cluster, task_definition, count, started_by, overrides):
+    def run_task(self, cluster, task_definition, count=1, started_by=None,
+                 overrides=None):
+        args = {}
+        if started_by:
+            args['startedBy'] = started_by
+        if overrides:
+            args['overrides'] = overrides
         return self.boto.run_task(
             cluster=cluster,
             taskDefinition=task_definition,
             count=count,
-            startedBy=started_by,
-            overrides=overrides
+            **args
         )
+
+    def run_tasks(self, cluster, task_definition, count, started_by=None,
+                  overrides=None):
+        """Start `count` tasks, in calls of at most MAX_RUN_TASK_COUNT.
+
+        Return the started tasks and the failures.
+        """
+        chunks = chunked(range(count), self.MAX_RUN_TASK_COUNT)
+        sizes = [len(c) for c in chunks]
+
+        def run(size):
+            return self.run_task(cluster, task_definition, size,
+                                 started_by, overrides)
+
+        if len(sizes) < 2:
+            responses = [run(size) for size in sizes]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                responses = list(pool.map(run, sizes))
+        tasks = [t for r in responses for t in r['tasks']]
+        failures = [f for r in responses for f in r.get('failures', [])]
+        return tasks, failures
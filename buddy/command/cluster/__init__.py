@@ -1,130 +1,382 @@
+from fnmatch import fnmatchcase
 import time
 
 import click
-import yaml
 
+from buddy.cache import get_state_cache
 from buddy.client import EcsClient, get_aws_region_name
-from buddy.command.utils import echo_action, echo_step, echo_error, failure
+from buddy.command.output import echo_rows, machine_value, output_option
+from buddy.command.utils import (
+    Echo, echo_error, echo_step, failure, run_parallel, start_tracing)
+from buddy.waiter import Backoff, Waiter
+from .deployment import DeploymentMonitor, FAILED, HealthMonitor
+from .gc import GarbageCollector
+from .run import TaskRun
+from .config import load_config
 from .service import Target, DefinitionError
+from .status import COLUMNS as STATUS_COLUMNS, FleetStatus
+from .taskdef import definition_hash, TaskDefinitionRegistry
 from buddy.error import handle_exception
 
 
+DEPLOY_BACKOFF = Backoff(initial=2, factor=1.5, maximum=15, jitter=0.25)
+
+
 class EcsServiceAction(object):
-    def __init__(self, client, cluster, service):
+    def __init__(self, client, cluster, service, echo=None):
         self.client = client
         self.cluster = cluster
         self.service = service
+        self.echo = echo or Echo()
+        self.diagnosis = None
 
     def _get_state(self):
         response = self.client.describe_services(self.cluster,
                                                  self.service)
         return response['services'][0]
 
-    def _print_deployments_progress(self, state):
-        click.echo("\nWait: deployment in progress")
-        for dep in state['deployments']:
-            msg = ("%(taskDefinition)s - %(status)s - "
-                   "running: %(runningCount)s")
-            click.echo(msg % dep)
-
-    def _is_deployed(self, state):
-        return len(state['deployments']) < 2
+    def _print_deployments_progress(self, state, events):
+        msg = ("%(taskDefinition)s - %(status)s - "
+               "running: %(runningCount)s")
+        lines = ["", "Wait: deployment in progress"]
+        lines.extend(msg % dep for dep in state['deployments'])
+        lines.extend('Event: %(message)s' % e for e in events)
+        self.echo('\n'.join(lines))
 
     def _print_state(self):
         state = self._get_state()
         state['events'] = state['events'][0:15]
-        click.echo(yaml.safe_dump(state))
+        self.echo(dump_yaml(state))
 
     def get_active_task_definition_arn(self):
         state = self._get_state()
         return state['taskDefinition']
 
-    def _poll_current_deployment(self):
+    def _poll_current_deployment(self, monitor, health=None):
         state = self._get_state()
-        self._print_deployments_progress(state)
-        return self._is_deployed(state)
-
-    def wait_for_deploy(self, timeout):
-        is_deployed = retry_it(self._poll_current_deployment, timeout)
-        click.echo("Final state:")
+        events = monitor.new_events(state)
+        self._print_deployments_progress(state, events)
+        status = monitor.status(state, events)
+        if status is None and health is not None:
+            self.diagnosis = health.check(events)
+            if self.diagnosis:
+                return FAILED
+        return status
+
+    def wait_for_deploy(self, timeout, task_definition_arn=None,
+                        backoff=DEPLOY_BACKOFF, health=None):
+        """Wait for the deployment, return DEPLOYED, FAILED or None on
+        timeout. With a HealthMonitor, stop early when the new tasks fail,
+        `diagnosis` says why."""
+        monitor = DeploymentMonitor(task_definition_arn)
+        waiter = Waiter(timeout, backoff, name='deploy')
+        self.diagnosis = None
+        status = waiter.wait(
+            lambda: self._poll_current_deployment(monitor, health))
+        self.echo("Final state:")
         self._print_state()
-        return is_deployed
+        self.echo.step('Waited %.1fs (%s polls)' % (
+            waiter.elapsed, waiter.attempts))
+        return status
 
 
-def retry_it(fn, timeout, interval=5):
-    STEPS = int(float(timeout) / interval)
-    for _ in range(STEPS):
-        result = fn()
-        if result:
-            return result
-        time.sleep(interval)
+def dump_yaml(data):
+    import yaml
+    return yaml.safe_dump(data)
 
 
 def read_app_cluster_config(path):
-    with open(path) as fp:
-        data = yaml.safe_load(fp)
-    return data
+    try:
+        return load_config(path)
+    except DefinitionError as err:
+        failure(err)
 
 
-def deploy_service(app, containers):
-    ecs = EcsClient()
+def select_targets(config, patterns, all_targets=False):
+    names = sorted(config.targets)
+    if all_targets:
+        return names
+    if not patterns:
+        failure('No target given (use target names, globs or --all)')
+
+    selected = []
+    for pattern in patterns:
+        matches = [n for n in names if fnmatchcase(n, pattern)]
+        if not matches:
+            failure('Unknown target: %s' % pattern)
+        selected.extend(n for n in matches if n not in selected)
+    return selected
+
+
+def deploy_service(app, containers, ecs=None, echo=None, force=False):
+    ecs = ecs or EcsClient()
+    echo = echo or Echo()
+    registry = TaskDefinitionRegistry(ecs)
+    ecs_service = EcsServiceAction(ecs, app.cluster_name, app.service_name,
+                                   echo=echo)
+
+    previous_task_definition_arn = (
+        ecs_service.get_active_task_definition_arn())
+    if not force and registry.matches(previous_task_definition_arn,
+                                      app.task_name,
+                                      definition_hash(containers)):
+        echo.step('Unchanged: %s is already deployed' %
+                  previous_task_definition_arn)
+        return
+
+    echo.action('Register task...')
+    task_definition_arn, registered = registry.register(
+        app.task_name, containers, reuse=not force)
+    if registered:
+        echo.step('Registered task: %s' % task_definition_arn)
+    else:
+        echo.step('Reusing task: %s' % task_definition_arn)
 
-    echo_action('Register task...')
-    resp = ecs.register_task_definition(family=app.task_name,
-                                        containers=containers)
-    task_definition_arn = resp['taskDefinition']['taskDefinitionArn']
-    echo_step('Registered task: %s' % task_definition_arn)
+    health = HealthMonitor(ecs, app.cluster_name, app.service_name,
+                           task_definition_arn)
+    health.start()
 
-    echo_action('Updating service %s' % app.service_name)
+    echo.action('Updating service %s' % app.service_name)
     ecs.update_service(
         app.cluster_name, app.service_name, task_definition_arn)
-    echo_step('Updated')
-
-    ecs_service = EcsServiceAction(ecs, app.cluster_name, app.service_name)
-
-    echo_step('Waiting for deployment to complete (300s)')
-    deployed = ecs_service.wait_for_deploy(timeout=300)
-    if not deployed:
-        failure("Deployment didn't finish in 300s")
+    echo.step('Updated')
+
+    echo.step('Waiting for deployment to complete (%ss)' % app.timeout)
+    status = ecs_service.wait_for_deploy(
+        timeout=app.timeout, task_definition_arn=task_definition_arn,
+        health=health)
+    if status is None:
+        problem = "Deployment didn't finish in %ss" % app.timeout
+    elif status == FAILED:
+        problem = 'Deployment failed (%s)' % (
+            ecs_service.diagnosis or 'rollout failed')
+    else:
+        problem = None
+    if problem:
+        echo.error(problem)
+        if app.rollback and previous_task_definition_arn not in (
+                None, task_definition_arn):
+            rollback_service(ecs_service, previous_task_definition_arn,
+                             app.timeout, echo)
+            problem += ', rolled back to %s' % previous_task_definition_arn
+        failure(problem)
 
     active_task_definition_arn = ecs_service.get_active_task_definition_arn()
     if active_task_definition_arn != task_definition_arn:
         failure('Deployment failed (active: %s)' % active_task_definition_arn)
 
-    echo_step('Success')
+    echo.step('Success')
+
+
+def rollback_service(ecs_service, task_definition_arn, timeout, echo):
+    echo.action('Rolling back to %s' % task_definition_arn)
+    ecs_service.client.update_service(
+        ecs_service.cluster, ecs_service.service, task_definition_arn)
+    status = ecs_service.wait_for_deploy(
+        timeout=timeout, task_definition_arn=task_definition_arn)
+    if status is None or status == FAILED:
+        failure('Rollback to %s failed' % task_definition_arn)
+    echo.step('Rolled back')
+
+
+def deploy_targets(plans, parallel, force=False):
+    ecs = EcsClient()
+
+    def deploy_one(plan):
+        app, containers = plan
+        deploy_service(app, containers, ecs=ecs, echo=Echo(app.target_name),
+                       force=force)
+
+    results = run_parallel(deploy_one, plans, parallel)
+
+    echo = Echo()
+    echo('\nSummary:')
+    failed = 0
+    for (app, _), _, error in results:
+        if error is None:
+            echo.step('%s: success' % app.target_name)
+        else:
+            failed += 1
+            if isinstance(error, click.ClickException):
+                error = error.format_message()
+            echo.error('%s: failed (%s)' % (app.target_name, error))
+
+    if failed:
+        failure('%s/%s deployments failed' % (failed, len(results)))
 
 
 @click.group()
-def cli():  # pragma: no cover
-    pass
+@click.option('--profile', is_flag=True,
+              help='Print a summary of the AWS calls and waits')
+@click.option('--trace', 'trace_path', metavar='FILE',
+              help='Write every AWS call and wait to FILE (JSON lines)')
+@click.pass_context
+def cli(ctx, profile, trace_path):
+    start_tracing(ctx, profile, trace_path)
 
 
 @cli.command()
 @click.argument('app-config-file')
-@click.argument('target-name')
+@click.argument('target-names', nargs=-1)
 @click.argument('image')
 @click.argument('build-rev')
+@click.option('--all', 'all_targets', is_flag=True)
+@click.option('--parallel', default=4, show_default=True)
 @click.option('--dry-run', is_flag=True)
+@click.option('--force', is_flag=True)
 @handle_exception
-def deploy(app_config_file, target_name, image, build_rev, dry_run):
+def deploy(app_config_file, target_names, image, build_rev, all_targets,
+           parallel, dry_run, force):
     config = read_app_cluster_config(app_config_file)
-
-    app = Target(config, target_name)
+    names = select_targets(config, target_names, all_targets)
 
     context = {}
-    context['task_name'] = app.task_name
     context['build_rev'] = build_rev
     context['aws_region'] = get_aws_region_name()
 
-    try:
-        containers = app.get_task_containers(image, context)
-    except DefinitionError as err:
-        failure(err)
-
-    click.secho('Definition:')
-    click.echo(yaml.safe_dump(containers))
+    plans = []
+    for name in names:
+        app = Target(config, name)
+        target_context = dict(context, task_name=app.task_name,
+                              target_name=name)
+        try:
+            containers = app.get_task_containers(image, target_context)
+        except DefinitionError as err:
+            failure(err)
+        plans.append((app, containers))
+
+    for app, containers in plans:
+        echo = Echo(app.target_name if len(plans) > 1 else None)
+        echo('Definition:\n' + dump_yaml(containers))
 
     if dry_run:
         echo_error("Dry-run!")
+    elif len(plans) == 1:
+        deploy_service(*plans[0], force=force)
     else:
-        deploy_service(app, containers)
+        deploy_targets(plans, parallel, force=force)
+
+
+@cli.command()
+@click.argument('app-config-file')
+@click.argument('target-names', nargs=-1)
+@click.option('--watch', is_flag=True)
+@click.option('--interval', default=5, show_default=True)
+@output_option
+@click.option('--fresh', is_flag=True, help='Ignore the state cache')
+@handle_exception
+def status(app_config_file, target_names, watch, interval, output, fresh):
+    config = read_app_cluster_config(app_config_file)
+    names = select_targets(config, target_names,
+                           all_targets=not target_names)
+    # --watch shows live state
+    cache = None if watch else get_state_cache(fresh)
+    fleet = FleetStatus(EcsClient(state_cache=cache),
+                        [Target(config, n) for n in names])
+    if output != 'table':
+        fleet.format_date = machine_value
+
+    previous = None
+    while True:
+        rows = fleet.refresh()
+        if rows != previous:
+            if watch and output == 'table':
+                click.clear()
+            echo_rows(rows, STATUS_COLUMNS, output=output)
+            previous = rows
+        if not watch:
+            break
+        time.sleep(interval)
+
+
+@cli.command()
+@click.argument('app-config-file')
+@click.option('--family', 'families', multiple=True)
+@click.option('--keep', default=10, show_default=True)
+@click.option('--parallel', default=4, show_default=True)
+@click.option('--rate', default=5.0, show_default=True)
+@click.option('--dry-run', is_flag=True)
+@output_option
+@handle_exception
+def gc(app_config_file, families, keep, parallel, rate, dry_run, output):
+    config = read_app_cluster_config(app_config_file)
+    # Only the clusters of the file are checked for revisions in use
+    unknown = [f for f in families if f not in config.tasks]
+    if unknown:
+        failure('Not a task of %s: %s' % (app_config_file, ', '.join(unknown)))
+    families = list(families) or sorted(config.tasks)
+    clusters = sorted(set(t.cluster for t in config.targets.values()))
+
+    collector = GarbageCollector(EcsClient(), keep=keep, parallel=parallel,
+                                 rate=rate)
+    plan = collector.plan(families, collector.in_use(clusters))
+    garbage = [arn for family in families for arn in plan[family][3]]
+
+    # Keep stdout parseable in the machine formats
+    echo = Echo(err=output != 'table')
+    failed = set()
+    if dry_run:
+        for arn in garbage:
+            echo('Would deregister %s' % arn)
+    else:
+        for arn, _, error in collector.deregister(garbage):
+            if error is not None:
+                failed.add(arn)
+                echo.error('Failed to deregister %s: %s' % (arn, error))
+
+    rows = []
+    for family in families:
+        revisions, kept, used, old = plan[family]
+        errors = len([arn for arn in old if arn in failed])
+        rows.append([family, len(revisions), len(kept), len(used),
+                     len(old) - errors, errors])
+    rows.append(['Total'] + [sum(row[i] for row in rows) for i in range(1, 6)])
+
+    deregistered = 'To deregister' if dry_run else 'Deregistered'
+    echo_rows(rows, ['Family', 'Revisions', 'Kept', 'In use', deregistered,
+                     'Failed'], output=output)
+    if dry_run:
+        echo.error('Dry-run!')
+    if failed:
+        failure('%s task definitions not deregistered' % len(failed))
+
+
+@cli.command()
+@click.argument('app-config-file')
+@click.argument('target-name')
+@click.argument('command', nargs=-1, required=True)
+@click.option('--container', help='Container to run the command in '
+              '(default: the first one of the task)')
+@click.option('--count', default=1, show_default=True)
+@click.option('--sharded', is_flag=True,
+              help='Pass BUDDY_SHARD_INDEX/BUDDY_SHARD_COUNT to each task')
+@click.option('--parallel', default=8, show_default=True)
+@click.option('--timeout', default=3600, show_default=True)
+@handle_exception
+def run(app_config_file, target_name, command, container, count, sharded,
+        parallel, timeout):
+    """Run COMMAND in one-off tasks of the target's task definition."""
+    config = read_app_cluster_config(app_config_file)
+    app = Target(config, select_targets(config, [target_name])[0])
+    container = container or app.task.containers[0].name
+    if container not in [c.name for c in app.task.containers]:
+        failure('Unknown container %s for task %s' % (
+            container, app.task_name))
+
+    ecs = EcsClient()
+    task_definition = EcsServiceAction(
+        ecs, app.cluster_name, app.service_name,
+    ).get_active_task_definition_arn()
+    click.echo('Running %s task(s) of %s' % (count, task_definition))
+
+    tasks = TaskRun(ecs, app.cluster_name, task_definition, container,
+                    command, count=count, sharded=sharded, parallel=parallel)
+    not_started = len(tasks.start())
+    if tasks.running and not tasks.wait(timeout):
+        failure("%s task(s) didn't finish in %ss" % (len(tasks.running),
+                                                     timeout))
+
+    failed = len(tasks.failed) + not_started
+    if failed:
+        failure('%s/%s tasks failed' % (failed, count))
+    echo_step('%s task(s) succeeded' % count)
@@ -0,0 +1,215 @@
+from .templating import compile_template
+
+
+class DefinitionError(Exception):
+    pass
+
+
+class ConfigError(DefinitionError):
+    def __init__(self, location, message):
+        super(ConfigError, self).__init__('%s: %s' % (location, message))
+        self.location = location
+
+
+def _mapping(data, location, required=True):
+    if data is None and not required:
+        return {}
+    if not isinstance(data, dict):
+        raise ConfigError(location, 'must be a mapping')
+    return data
+
+
+def _string_list(data, location):
+    if not isinstance(data, list) or not all(
+            isinstance(e, str) for e in data):
+        raise ConfigError(location, 'must be a list of names')
+    return data
+
+
+def _check_keys(data, location, required, optional=()):
+    for key in required:
+        if key not in data:
+            raise ConfigError(location, 'missing %r' % key)
+    for key in data:
+        if key not in required and key not in optional:
+            raise ConfigError('%s.%s' % (location, key), 'unknown key')
+
+
+class ContainerConfig(object):
+    __slots__ = ('name', 'properties', 'environment', 'template')
+
+    def __init__(self, name, properties, environment):
+        self.name = name
+        self.properties = properties
+        self.environment = environment
+        self.template = compile_template(properties)
+
+
+class TaskConfig(object):
+    __slots__ = ('name', 'containers')
+
+    def __init__(self, name, containers):
+        self.name = name
+        self.containers = containers
+
+
+class TargetConfig(object):
+    __slots__ = ('name', 'cluster', 'service', 'task', 'environment_name',
+                 'environment', 'timeout', 'rollback')
+
+    def __init__(self, name, cluster, service, task, environment_name,
+                 environment, timeout=300, rollback=False):
+        self.name = name
+        self.cluster = cluster
+        self.service = service
+        self.task = task
+        self.environment_name = environment_name
+        self.environment = environment
+        self.timeout = timeout
+        self.rollback = rollback
+
+
+class ClusterConfig(object):
+    """The cluster file, validated as a whole and with references resolved."""
+
+    __slots__ = ('targets', 'tasks', 'containers', 'environments')
+
+    TARGET_KEYS = ['cluster', 'service', 'task']
+    TARGET_OPTIONAL_KEYS = ['environment', 'timeout', 'rollback']
+    DEFAULT_TIMEOUT = 300
+    CONTAINER_KEYS = ['properties', 'environment']
+
+    def __init__(self, targets, tasks, containers, environments):
+        self.targets = targets
+        self.tasks = tasks
+        self.containers = containers
+        self.environments = environments
+
+    @classmethod
+    def compile(cls, data, source='config'):
+        data = _mapping(data, source)
+        _check_keys(data, source, required=['targets', 'tasks', 'containers'],
+                    optional=['environments'])
+
+        def where(*parts):
+            return '%s: %s' % (source, '.'.join(parts))
+
+        environments = cls._compile_environments(data, where)
+        containers = cls._compile_containers(data, where)
+        tasks = cls._compile_tasks(data, where, containers)
+        targets = {
+            name: cls._compile_target(name, spec, where('targets', name),
+                                      tasks, environments)
+            for name, spec in _mapping(data['targets'],
+                                       where('targets')).items()
+        }
+        return cls(targets, tasks, containers, environments)
+
+    @staticmethod
+    def _compile_environments(data, where):
+        return {
+            name: dict(_mapping(variables, where('environments', name),
+                                required=False))
+            for name, variables in _mapping(data.get('environments'),
+                                            where('environments'),
+                                            required=False).items()
+        }
+
+    @classmethod
+    def _compile_containers(cls, data, where):
+        containers = {}
+        for name, spec in _mapping(data['containers'],
+                                   where('containers')).items():
+            spec = _mapping(spec, where('containers', name))
+            _check_keys(spec, where('containers', name), required=[],
+                        optional=cls.CONTAINER_KEYS)
+            containers[name] = ContainerConfig(
+                name=name,
+                properties=_mapping(spec.get('properties'),
+                                    where('containers', name, 'properties'),
+                                    required=False),
+                environment=_string_list(
+                    spec.get('environment') or [],
+                    where('containers', name, 'environment')),
+            )
+        return containers
+
+    @staticmethod
+    def _compile_tasks(data, where, containers):
+        tasks = {}
+        for name, spec in _mapping(data['tasks'], where('tasks')).items():
+            spec = _mapping(spec, where('tasks', name))
+            _check_keys(spec, where('tasks', name), required=['containers'])
+            names = _string_list(spec['containers'],
+                                 where('tasks', name, 'containers'))
+            for container in names:
+                if container not in containers:
+                    raise ConfigError(where('tasks', name, 'containers'),
+                                      'unknown container %r' % container)
+            tasks[name] = TaskConfig(name, [containers[c] for c in names])
+        return tasks
+
+    @staticmethod
+    def _check_environment(location, task, environment):
+        for container in task.containers:
+            for variable in container.environment:
+                if variable not in environment:
+                    raise ConfigError(
+                        location,
+                        'Unknown environment variable %r (container %s)'
+                        % (variable, container.name))
+
+    @classmethod
+    def _compile_target(cls, name, spec, location, tasks, environments):
+        spec = _mapping(spec, location)
+        _check_keys(spec, location, required=cls.TARGET_KEYS,
+                    optional=cls.TARGET_OPTIONAL_KEYS)
+        if spec['task'] not in tasks:
+            raise ConfigError(location + '.task',
+                              'unknown task %r' % spec['task'])
+        environment_name = spec.get('environment')
+        if environment_name and environment_name not in environments:
+            raise ConfigError(location + '.environment',
+                              'Missing environment %s' % environment_name)
+        environment = environments.get(environment_name, {})
+        task = tasks[spec['task']]
+        cls._check_environment(location, task, environment)
+
+        return TargetConfig(
+            name=name,
+            cluster=spec['cluster'],
+            service=spec['service'],
+            task=task,
+            environment_name=environment_name,
+            environment=environment,
+            **cls._deploy_options(spec, location)
+        )
+
+    @classmethod
+    def _deploy_options(cls, spec, location):
+        timeout = spec.get('timeout', cls.DEFAULT_TIMEOUT)
+        if (not isinstance(timeout, int) or isinstance(timeout, bool) or
+                timeout <= 0):
+            raise ConfigError(location + '.timeout',
+                              'must be a number of seconds')
+        rollback = spec.get('rollback', False)
+        if not isinstance(rollback, bool):
+            raise ConfigError(location + '.rollback',
+                              'must be true or false')
+        return {'timeout': timeout, 'rollback': rollback}
+
+
+def _yaml_loader():
+    import yaml
+    return getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def load_config(path):
+    """Read and compile a cluster file."""
+    import yaml
+    with open(path, 'rb') as fp:
+        try:
+            data = yaml.load(fp, Loader=_yaml_loader())
+        except yaml.YAMLError as err:
+            raise ConfigError(path, 'invalid YAML: %s' % err)
+    return ClusterConfig.compile(data, source=path)
@@ -0,0 +1,125 @@
+from collections import Counter
+
+
+DEPLOYED = 'deployed'
+FAILED = 'failed'
+
+STEADY_STATE_MARKER = 'has reached a steady state'
+
+# Service events meaning the new tasks cannot run
+FAILURE_EVENT_MARKERS = [
+    'is unable to consistently start tasks successfully',
+    'deployment failed',
+]
+FAILURE_STOP_CODES = ['TaskFailedToStart', 'EssentialContainerExited']
+
+
+class DeploymentMonitor(object):
+    """Decide whether a service deployment is over from its state.
+
+    The deployment is complete when the primary deployment runs the
+    expected task definition at its desired count and no other deployment
+    has running tasks left, or when a new steady-state event shows up.
+    """
+
+    def __init__(self, task_definition_arn=None):
+        self.task_definition_arn = task_definition_arn
+        self.seen_events = None
+
+    def new_events(self, state):
+        events = state.get('events', [])
+        if self.seen_events is None:
+            self.seen_events = set(e['id'] for e in events)
+            return []
+        new = [e for e in events if e['id'] not in self.seen_events]
+        self.seen_events.update(e['id'] for e in new)
+        return list(reversed(new))
+
+    def _primary(self, state):
+        for dep in state['deployments']:
+            if dep['status'] == 'PRIMARY':
+                return dep
+
+    def status(self, state, events):
+        primary = self._primary(state)
+        if primary is None:
+            return None
+        expected = self.task_definition_arn or primary['taskDefinition']
+        if primary['taskDefinition'] != expected:
+            return None
+        if primary.get('rolloutState') == 'FAILED':
+            return FAILED
+
+        others = [d for d in state['deployments'] if d is not primary]
+        converged = (
+            primary['runningCount'] == primary['desiredCount'] and
+            not any(d['runningCount'] for d in others)
+        )
+        steady = any(STEADY_STATE_MARKER in e['message'] for e in events)
+        if converged or steady:
+            return DEPLOYED
+
+
+def task_failure(task):
+    """Return why a stopped task failed, or None if it was just stopped."""
+    containers = [
+        '%s exited with %s' % (c['name'], c['exitCode'])
+        if c.get('exitCode') not in (None, 0) else
+        '%s: %s' % (c['name'], c['reason'])
+        for c in task.get('containers', [])
+        if c.get('exitCode') not in (None, 0) or c.get('reason')
+    ]
+    reason = task.get('stoppedReason') or ''
+    if not (containers or task.get('stopCode') in FAILURE_STOP_CODES or
+            'health check' in reason.lower()):
+        return None
+    return '; '.join([reason] + containers if reason else containers)
+
+
+class HealthMonitor(object):
+    """Detect a failing deployment before it times out.
+
+    The deployment is unhealthy once `max_failures` tasks of the new task
+    definition stopped on an error (exit code, failed start or health
+    check), or as soon as the service events report that its tasks
+    cannot start.
+    """
+
+    def __init__(self, ecs, cluster, service, task_definition_arn,
+                 max_failures=3):
+        self.ecs = ecs
+        self.cluster = cluster
+        self.service = service
+        self.task_definition_arn = task_definition_arn
+        self.max_failures = max_failures
+        self.seen_tasks = set()
+        self.failures = []
+
+    def _stopped_tasks(self):
+        return list(self.ecs.list_task_arns(self.cluster, self.service,
+                                            desired_status='STOPPED'))
+
+    def start(self):
+        """Ignore the tasks stopped before the deployment."""
+        self.seen_tasks.update(self._stopped_tasks())
+
+    def check(self, events):
+        """Return a diagnosis if the deployment is failing, else None."""
+        for event in events:
+            if any(m in event['message'] for m in FAILURE_EVENT_MARKERS):
+                return event['message']
+
+        arns = [a for a in self._stopped_tasks() if a not in self.seen_tasks]
+        self.seen_tasks.update(arns)
+        tasks = self.ecs.describe_tasks_batch(
+            (self.cluster, arn) for arn in arns)
+        for task in tasks.values():
+            if task.get('taskDefinitionArn') == self.task_definition_arn:
+                failure = task_failure(task)
+                if failure:
+                    self.failures.append(failure)
+
+        if len(self.failures) >= self.max_failures:
+            reason, count = Counter(self.failures).most_common(1)[0]
+            return '%s tasks failed, %s times: %s' % (
+                len(self.failures), count, reason)
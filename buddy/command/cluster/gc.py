@@ -0,0 +1,72 @@
+from buddy.command.utils import run_parallel
+from buddy.ratelimit import TokenBucket
+
+
+def revision(task_definition_arn):
+    return int(task_definition_arn.rsplit(':', 1)[1])
+
+
+class GarbageCollector(object):
+    """Find and deregister the old revisions of task definition families.
+
+    The `keep` newest revisions of each family are kept, as well as any
+    revision used by a service (or one of its deployments).
+    """
+
+    def __init__(self, ecs, keep=10, parallel=4, rate=5.0):
+        self.ecs = ecs
+        self.keep = keep
+        self.parallel = parallel
+        self.rate = rate
+
+    async def _list_services(self, clusters):
+        import asyncio
+        from buddy.aio import AsyncClient, collect
+        ecs = AsyncClient(self.ecs)
+        return await asyncio.gather(*[
+            collect(ecs.list_services(cluster)) for cluster in clusters
+        ])
+
+    def in_use(self, clusters):
+        from buddy.aio import run
+        listed = run(self._list_services(clusters))
+        services = [
+            (cluster, arn)
+            for cluster, arns in zip(clusters, listed)
+            for arn in arns
+        ]
+        used = set()
+        for service in self.ecs.describe_services_batch(services).values():
+            used.add(service['taskDefinition'])
+            used.update(d['taskDefinition'] for d in service['deployments'])
+        return used
+
+    def plan(self, families, in_use):
+        """Return {family: (revisions, kept, used, garbage)}."""
+        def list_family(family):
+            arns = self.ecs.list_task_definitions(family)
+            return sorted(arns, key=revision, reverse=True)
+
+        plan = {}
+        for family, arns, error in run_parallel(list_family, families,
+                                                self.parallel):
+            if error is not None:
+                raise error
+            old = arns[self.keep:]
+            plan[family] = (
+                arns,
+                arns[:self.keep],
+                [arn for arn in old if arn in in_use],
+                [arn for arn in old if arn not in in_use],
+            )
+        return plan
+
+    def deregister(self, arns):
+        """Deregister concurrently, return the list of (arn, None, error)."""
+        bucket = TokenBucket(self.rate, burst=1)
+
+        def deregister_one(arn):
+            bucket.acquire()
+            self.ecs.deregister_task_definition(arn)
+
+        return run_parallel(deregister_one, arns, self.parallel)
@@ -0,0 +1,106 @@
+from buddy.command.utils import Echo, run_parallel
+from buddy.waiter import Backoff, Waiter
+
+
+RUN_BACKOFF = Backoff(initial=2, factor=1.5, maximum=15, jitter=0.25)
+
+SHARD_INDEX_VARIABLE = 'BUDDY_SHARD_INDEX'
+SHARD_COUNT_VARIABLE = 'BUDDY_SHARD_COUNT'
+
+
+def task_id(task_arn):
+    return task_arn.rsplit('/', 1)[-1]
+
+
+class TaskRun(object):
+    """Run one-off tasks and follow them until they stop.
+
+    In sharded mode each task gets its index (and the number of tasks) in
+    its environment, so a job can split its work between the tasks.
+    """
+
+    def __init__(self, ecs, cluster, task_definition, container, command,
+                 count=1, sharded=False, started_by='buddy', parallel=8,
+                 echo=None):
+        self.ecs = ecs
+        self.cluster = cluster
+        self.task_definition = task_definition
+        self.container = container
+        self.command = list(command)
+        self.count = count
+        self.sharded = sharded
+        self.started_by = started_by
+        self.parallel = parallel
+        self.echo = echo or Echo()
+        self.running = []
+        self.exit_codes = {}
+
+    def overrides(self, index=None):
+        override = {'name': self.container, 'command': self.command}
+        if index is not None:
+            override['environment'] = [
+                {'name': SHARD_INDEX_VARIABLE, 'value': str(index)},
+                {'name': SHARD_COUNT_VARIABLE, 'value': str(self.count)},
+            ]
+        return {'containerOverrides': [override]}
+
+    def start(self):
+        """Start the tasks, return the launch failures."""
+        if self.sharded:
+            def run_shard(index):
+                return self.ecs.run_tasks(
+                    self.cluster, self.task_definition, 1,
+                    self.started_by, self.overrides(index))
+
+            tasks, failures = [], []
+            for index, result, error in run_parallel(
+                    run_shard, range(self.count), self.parallel):
+                if error is not None:
+                    failures.append({'arn': 'shard %s' % index,
+                                     'reason': str(error)})
+                else:
+                    tasks.extend(result[0])
+                    failures.extend(result[1])
+        else:
+            tasks, failures = self.ecs.run_tasks(
+                self.cluster, self.task_definition, self.count,
+                self.started_by, self.overrides())
+
+        self.running = [t['taskArn'] for t in tasks]
+        for task_arn in self.running:
+            self.echo('Started task %s' % task_id(task_arn))
+        for failure in failures:
+            self.echo.error('Failed to start: %s (%s)' % (
+                failure.get('arn'), failure.get('reason')))
+        return failures
+
+    def exit_code(self, task):
+        for container in task.get('containers', []):
+            if container['name'] == self.container:
+                return container.get('exitCode')
+
+    def poll(self):
+        """Describe the running tasks, return True once all have stopped."""
+        tasks = self.ecs.describe_tasks_batch(
+            (self.cluster, arn) for arn in self.running)
+        for task_arn in list(self.running):
+            task = tasks.get(task_arn)
+            if task is None or task['lastStatus'] != 'STOPPED':
+                continue
+            self.running.remove(task_arn)
+            code = self.exit_code(task)
+            self.exit_codes[task_arn] = code
+            if code == 0:
+                self.echo.step('Task %s: exit code 0' % task_id(task_arn))
+            else:
+                self.echo.error('Task %s: exit code %s (%s)' % (
+                    task_id(task_arn), code, task.get('stoppedReason', '')))
+        return not self.running
+
+    def wait(self, timeout, backoff=RUN_BACKOFF):
+        waiter = Waiter(timeout, backoff, name='run-tasks')
+        return bool(waiter.wait(self.poll))
+
+    @property
+    def failed(self):
+        return [arn for arn, code in self.exit_codes.items() if code != 0]
@@ -1,40 +1,82 @@
+from .config import ClusterConfig, DefinitionError  # noqa
 
-class DefinitionError(Exception):
-    pass
+
+CONFIGURATORS_ENTRY_POINT = 'buddy.configurators'
 
 
 def cloudwatch_log_configurator(context, properties):
-    config = properties.get('logConfiguration', {})
-    if config.get('logDriver') == 'awslogs':
-        options = {
-            'awslogs-group': context.get('task_name'),
-            'awslogs-region': context.get('aws_region'),
-            'awslogs-stream-prefix': context.get('build_rev'),
-        }
-        options.update(config.get('options', {}))
-        config['options'] = options
-    return properties
-
-
-def make_container_definition(definition, name, image, environment, context):
-    props = definition['properties'].copy()
-    props['name'] = name
+    config = properties.get('logConfiguration') or {}
+    if config.get('logDriver') != 'awslogs':
+        return properties
+    options = {
+        'awslogs-group': context.get('task_name'),
+        'awslogs-region': context.get('aws_region'),
+        'awslogs-stream-prefix': context.get('build_rev'),
+    }
+    options.update(config.get('options') or {})
+    return dict(properties, logConfiguration=dict(config, options=options))
+
+
+BUILTIN_CONFIGURATORS = [
+    ('cloudwatch_logs', cloudwatch_log_configurator),
+]
+
+
+def _entry_points(group):
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python < 3.8
+        import pkg_resources
+        return list(pkg_resources.iter_entry_points(group))
+    found = entry_points()
+    if hasattr(found, 'select'):
+        return list(found.select(group=group))
+    return list(found.get(group, []))
+
+
+_configurators = None
+
+
+def get_configurators():
+    """Return the configurators: the builtin ones, then the ones registered
+    by other packages in the `buddy.configurators` entry point group.
+
+    A configurator is called with (context, properties) and returns the
+    new properties, it must not modify the properties it receives.
+    """
+    global _configurators
+    if _configurators is None:
+        builtin = [name for name, _ in BUILTIN_CONFIGURATORS]
+        plugins = sorted(
+            (ep for ep in _entry_points(CONFIGURATORS_ENTRY_POINT)
+             if ep.name not in builtin),
+            key=lambda ep: ep.name,
+        )
+        _configurators = (
+            [fn for _, fn in BUILTIN_CONFIGURATORS] +
+            [ep.load() for ep in plugins]
+        )
+    return _configurators
+
+
+def make_container_definition(container, image, environment, context):
+    props = container.template(context)
+    props['name'] = container.name
     props.setdefault('image', str(image))
 
     def get_variables(name):
         return {'name': name, 'value': environment[name]}
 
-    required_variables = definition.get('environment')
-    if required_variables:
+    if container.environment:
         try:
             props['environment'] = [
                 get_variables(v)
-                for v in required_variables
+                for v in container.environment
             ]
         except KeyError as err:
             raise DefinitionError("Unknown environment variable %s" % err)
 
-    for configurator in [cloudwatch_log_configurator]:
+    for configurator in get_configurators():
         props = configurator(context, props)
 
     return props
@@ -42,34 +84,31 @@ def make_container_definition(definition, name, image, environment, context):
 
 class Target(object):
 
-    def __init__(self, data, target_name):
-        self.data = data
+    def __init__(self, config, target_name):
+        if not isinstance(config, ClusterConfig):
+            config = ClusterConfig.compile(config)
+        self.config = config
         self.target_name = target_name
 
-        target_data = data['targets'][target_name]
-        self.cluster_name = target_data['cluster']
-        self.service_name = target_data['service']
-        self.task_name = target_data['task']
-        self.task = data['tasks'][self.task_name]
-
-        self.environment = {}
-        environment_name = target_data.get('environment')
-        if environment_name:
-            try:
-                plain_vars = data['environments'][environment_name]
-            except KeyError:
-                raise KeyError('Missing environment %s' % environment_name)
-            self.environment.update(**plain_vars)
-
-        self.container_definitions = self.data['containers']
+        try:
+            target = config.targets[target_name]
+        except KeyError:
+            raise DefinitionError('Unknown target: %s' % target_name)
+        self.cluster_name = target.cluster
+        self.service_name = target.service
+        self.task_name = target.task.name
+        self.task = target.task
+        self.environment = target.environment
+        self.timeout = target.timeout
+        self.rollback = target.rollback
 
     def get_task_containers(self, image, context):
-        def make(container_name):
-            return make_container_definition(
-                definition=self.container_definitions[container_name],
-                name=container_name,
+        return [
+            make_container_definition(
+                container=container,
                 image=image,
                 environment=self.environment,
                 context=context,
             )
-        return [make(el) for el in self.task['containers']]
+            for container in self.task.containers
+        ]
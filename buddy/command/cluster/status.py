@@ -0,0 +1,127 @@
+from collections import Counter
+
+from buddy.command.utils import human_date
+
+
+COLUMNS = [
+    'Target',
+    'Cluster',
+    'Service',
+    'Desired',
+    'Running',
+    'Pending',
+    'Task definition',
+    'Deployments',
+    'Deployed',
+    'Tasks',
+]
+
+
+def _signature(service):
+    return (
+        service['taskDefinition'],
+        service['runningCount'],
+        service['pendingCount'],
+        tuple(
+            (d['id'], d['runningCount'], d['pendingCount'])
+            for d in service['deployments']
+        ),
+    )
+
+
+class FleetStatus(object):
+    """Collect the state of the services of many targets.
+
+    Services are described in batches on every refresh. Tasks are only
+    listed again for services whose deployments or counts changed, and
+    each task definition is described once. Tasks and task definitions
+    are fetched concurrently, on an event loop.
+    """
+
+    def __init__(self, ecs, targets, parallel=8, format_date=human_date):
+        self.ecs = ecs
+        self.targets = targets
+        self.parallel = parallel
+        self.format_date = format_date
+        self.signatures = {}
+        self.tasks = {}
+        self.task_definitions = {}
+
+    def refresh(self):
+        from buddy.aio import run
+        return run(self.refresh_async())
+
+    async def refresh_async(self):
+        import asyncio
+        from buddy.aio import AsyncClient
+        ecs = AsyncClient(self.ecs)
+        keys = [(t.cluster_name, t.service_name) for t in self.targets]
+        services = await ecs.describe_services_batch(keys)
+
+        changed = [
+            key for key, service in services.items()
+            if self.signatures.get(key) != _signature(service)
+        ]
+        await asyncio.gather(
+            self._refresh_tasks(ecs, changed),
+            self._refresh_task_definitions(
+                ecs, [s['taskDefinition'] for s in services.values()]),
+        )
+        for key in changed:
+            self.signatures[key] = _signature(services[key])
+
+        return [
+            self._row(t, services.get((t.cluster_name, t.service_name)))
+            for t in self.targets
+        ]
+
+    async def _limited(self, semaphore, method, *args):
+        async with semaphore:
+            return await method(*args)
+
+    async def _refresh_tasks(self, ecs, keys):
+        import asyncio
+        semaphore = asyncio.Semaphore(self.parallel)
+        listed = await asyncio.gather(*[
+            self._limited(semaphore, ecs.list_tasks, *key) for key in keys
+        ])
+        listed = [(key, r['taskArns']) for key, r in zip(keys, listed)]
+
+        described = await ecs.describe_tasks_batch(
+            [(key[0], arn) for key, arns in listed for arn in arns])
+        for key, arns in listed:
+            self.tasks[key] = [described[a] for a in arns if a in described]
+
+    async def _refresh_task_definitions(self, ecs, arns):
+        import asyncio
+        semaphore = asyncio.Semaphore(self.parallel)
+        missing = sorted(set(arns) - set(self.task_definitions))
+        described = await asyncio.gather(*[
+            self._limited(semaphore, ecs.describe_task_definition, arn)
+            for arn in missing
+        ])
+        for arn, response in zip(missing, described):
+            self.task_definitions[arn] = response['taskDefinition']
+
+    def _row(self, target, service):
+        row = [target.target_name, target.cluster_name, target.service_name]
+        if service is None:
+            return row + ['MISSING'] + [''] * (len(COLUMNS) - 4)
+
+        definition = self.task_definitions[service['taskDefinition']]
+        primary = [d for d in service['deployments']
+                   if d['status'] == 'PRIMARY']
+        tasks = Counter(
+            t['lastStatus']
+            for t in self.tasks.get((target.cluster_name,
+                                     target.service_name), [])
+        )
+        return row + [
+            service['desiredCount'],
+            service['runningCount'],
+            service['pendingCount'],
+            '%(family)s:%(revision)s' % definition,
+            len(service['deployments']),
+            self.format_date(primary[0]['createdAt']) if primary else '',
+            ', '.join('%s: %s' % item for item in sorted(tasks.items())),
+        ]
@@ -0,0 +1,78 @@
+import hashlib
+import json
+
+from buddy.cache import FileCache
+
+
+DEFINITION_HASH_TAG = 'buddy:definition-hash'
+
+
+def definition_hash(containers, volumes=None):
+    content = json.dumps([containers, volumes or []], sort_keys=True,
+                         separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class TaskDefinitionRegistry(object):
+    """Register task definitions, reusing an identical ACTIVE revision.
+
+    Revisions are tagged with the hash of their definition. The revisions
+    registered for a hash are also remembered locally (per family), so a
+    rollback to an older definition reuses its revision too. Without the
+    ecs:TagResource permission, revisions are registered untagged and
+    never reused.
+    """
+
+    def __init__(self, ecs, cache=None):
+        self.ecs = ecs
+        self.cache = cache or FileCache('task-definitions')
+
+    def _cache_key(self, family, digest):
+        return hashlib.sha256(
+            ('%s:%s' % (family, digest)).encode('utf-8')).hexdigest()
+
+    def matches(self, task_definition_arn, family, digest):
+        if not task_definition_arn:
+            return False
+        response = self.ecs.describe_task_definition(task_definition_arn,
+                                                     include_tags=True)
+        definition = response['taskDefinition']
+        tags = {t['key']: t['value'] for t in response.get('tags', [])}
+        return (
+            definition['family'] == family and
+            definition['status'] == 'ACTIVE' and
+            tags.get(DEFINITION_HASH_TAG) == digest
+        )
+
+    def find(self, family, digest):
+        cached = self.cache.get(self._cache_key(family, digest))
+        if cached and self.matches(cached['arn'], family, digest):
+            return cached['arn']
+
+    def _register_tagged(self, family, containers, digest):
+        import botocore.exceptions
+        try:
+            response = self.ecs.register_task_definition(
+                family=family, containers=containers,
+                tags={DEFINITION_HASH_TAG: digest},
+            )
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] != 'AccessDeniedException':
+                raise
+            response = self.ecs.register_task_definition(
+                family=family, containers=containers)
+            return response['taskDefinition']['taskDefinitionArn'], False
+        return response['taskDefinition']['taskDefinitionArn'], True
+
+    def register(self, family, containers, reuse=True):
+        """Return the arn of the task definition and if it is a new one."""
+        digest = definition_hash(containers)
+        if reuse:
+            arn = self.find(family, digest)
+            if arn:
+                return arn, False
+
+        arn, tagged = self._register_tagged(family, containers, digest)
+        if tagged:
+            self.cache.set(self._cache_key(family, digest), {'arn': arn})
+        return arn, True
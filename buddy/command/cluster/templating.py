@@ -0,0 +1,36 @@
+import re
+
+
+PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+
+def _render_string(value):
+    parts = PLACEHOLDER.split(value)
+    if len(parts) == 1:
+        return lambda context: value
+
+    def render(context):
+        # parts alternates literal text and placeholder names
+        return ''.join(
+            part if n % 2 == 0 else str(context.get(part, '{%s}' % part))
+            for n, part in enumerate(parts)
+        )
+    return render
+
+
+def compile_template(value):
+    """Compile a structure into a function building it from a context.
+
+    `{name}` placeholders in strings are replaced by the context values
+    (unknown names are left untouched). Every call returns new dicts and
+    lists, so callers may modify them without touching the template.
+    """
+    if isinstance(value, str):
+        return _render_string(value)
+    if isinstance(value, dict):
+        items = [(k, compile_template(v)) for k, v in value.items()]
+        return lambda context: {k: render(context) for k, render in items}
+    if isinstance(value, list):
+        renders = [compile_template(v) for v in value]
+        return lambda context: [render(context) for render in renders]
+    return lambda context: value
@@ -0,0 +1,94 @@
+import csv
+import datetime
+import io
+import json
+
+import click
+
+from buddy.command.utils import human_date, tabulate
+
+
+OUTPUT_FORMATS = ['table', 'json', 'jsonl', 'csv']
+
+output_option = click.option(
+    '--output', '-o', type=click.Choice(OUTPUT_FORMATS), default='table',
+    show_default=True, help='table is buffered, the other formats stream')
+
+
+def machine_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def _default(value):
+    value = machine_value(value)
+    return value if isinstance(value, str) else str(value)
+
+
+def _json(data, **kwargs):
+    return json.dumps(data, default=_default, sort_keys=True, **kwargs)
+
+
+def _csv_cell(value):
+    value = machine_value(value)
+    return _json(value) if isinstance(value, (list, dict)) else value
+
+
+def _csv_line(row):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator='').writerow([_csv_cell(v) for v in row])
+    return buf.getvalue()
+
+
+def format_value(column, value, output, filters=None):
+    """Format a cell: humanized dates in tables, ISO 8601 otherwise."""
+    if output != 'table':
+        return machine_value(value)
+    if filters and column in filters:
+        return filters[column](value)
+    if 'time' in column.lower():
+        return human_date(value)
+    return value
+
+
+def echo_rows(rows, columns, output='table', pager=False, echo=click.echo):
+    """Print rows (lists of values) in the chosen format.
+
+    Except for tables, which need all the rows to size their columns, rows
+    are printed as they come: pass an iterator to keep memory constant.
+    """
+    if output == 'table':
+        text = tabulate(list(rows), headers=columns)
+        if pager:
+            click.echo_via_pager(text)
+        else:
+            echo(text)
+    elif output == 'jsonl':
+        for row in rows:
+            echo(_json(dict(zip(columns, row))))
+    elif output == 'csv':
+        echo(_csv_line(columns))
+        for row in rows:
+            echo(_csv_line(row))
+    else:
+        # A JSON array written element by element
+        separator = '['
+        for row in rows:
+            echo(separator + _json(dict(zip(columns, row))), nl=False)
+            separator = ',\n'
+        echo('[]' if separator == '[' else ']')
+
+
+def echo_mapping(mapping, output='table', echo=click.echo):
+    """Print a single record (an API response for example)."""
+    items = [(k, v) for k, v in mapping.items() if k != 'ResponseMetadata']
+    if output == 'table':
+        echo(tabulate([list(item) for item in items]))
+    elif output == 'csv':
+        echo(_csv_line(['Key', 'Value']))
+        for key, value in items:
+            echo(_csv_line([key, value]))
+    else:
+        indent = 2 if output == 'json' else None
+        echo(_json(dict(items), indent=indent))
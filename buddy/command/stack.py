@@ -1,32 +1,100 @@
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+import glob
+import hashlib
+import json
 import os
+import re
+import time
 
-from tabulate import tabulate
-import arrow
-import botocore.exceptions
 import click
-import yaml
 
+from buddy.cache import FileCache, get_state_cache
 from buddy.client import CfnClient
+from buddy.command.output import (
+    echo_mapping, echo_rows, format_value, output_option)
+from buddy.command.utils import (
+    Echo, run_parallel, start_tracing, tabulate)
 from buddy.error import handle_exception
+from buddy.outputs import OutputError, OutputIndex
+from buddy.template import check_template, template_hash, TemplateError
+from buddy.waiter import Backoff, Waiter
+
+
+# arrow, yaml and botocore are imported where they are used, to keep the
+# startup of the command fast
+
+
+class StackError(Exception):
+    pass
+
+
+def canonical_template(template):
+    if not isinstance(template, dict):
+        try:
+            template = json.loads(template)
+        except ValueError:
+            return template.strip()
+    return json.dumps(template, sort_keys=True, separators=(',', ':'))
+
+
+def fingerprint(template, parameters):
+    content = json.dumps([canonical_template(template),
+                          sorted(parameters.items())])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+CHANGE_SET_BACKOFF = Backoff(initial=1, factor=1.5, maximum=5, jitter=0.1)
+
+EMPTY_CHANGE_SET_REASONS = [
+    "didn't contain changes",
+    'No updates are to be performed',
+]
+
+
+def read_file(path):
+    with open(path) as fp:
+        return fp.read()
 
 
 class Template(object):
-    def __init__(self, client, path):
+    def __init__(self, client, path, cache=None):
         self.client = client
         self.path = path
+        self.cache = cache
 
     @property
     def template_body(self):
-        with open(self.path) as fp:
-            return fp.read()
+        if not hasattr(self, '_template_body'):
+            self._template_body = read_file(self.path)
+        return self._template_body
+
+    def check(self):
+        problems = check_template(self.template_body)
+        if problems:
+            raise TemplateError('%s: %s' % (self.path, ', '.join(problems)))
 
     def validate(self):
-        return self.client.validate_template(self.template_body)
+        self.check()
+        key = template_hash(self.template_body)
+        response = self.cache.get(key) if self.cache else None
+        if response is None:
+            response = self.client.validate_template(self.template_body)
+            response.pop('ResponseMetadata', None)
+            if self.cache:
+                self.cache.set(key, response)
+        return response
+
+
+def validation_cache():
+    return FileCache('validate')
 
 
 class Stack(object):
-    def __init__(self, client, name_or_path):
+    def __init__(self, client, name_or_path, outputs=None, skip_check=False):
         self.client = client
+        self.outputs = outputs or OutputIndex.for_client(client)
+        self.skip_check = skip_check
         if self._detect_stack_file(name_or_path):
             self.path = name_or_path
             self.name = self._name_from_file()
@@ -44,8 +112,9 @@ class Stack(object):
     @property
     def properties(self):
         if not hasattr(self, '_properties'):
+            import yaml
             with open(self.path) as fp:
-                self._properties = yaml.load(fp)
+                self._properties = yaml.safe_load(fp)
         return self._properties
 
     @property
@@ -56,19 +125,47 @@ class Stack(object):
 
     @property
     def template_body(self):
-        with open(self.template_path) as fp:
-            return fp.read()
+        if not hasattr(self, '_template_body'):
+            self._template_body = read_file(self.template_path)
+        return self._template_body
+
+    def check(self):
+        if self.skip_check:
+            return
+        # Names only: references may point at stacks not created yet
+        problems = check_template(self.template_body,
+                                  self.properties.get('parameters') or {})
+        if problems:
+            raise TemplateError('%s: %s' % (self.template_path,
+                                            ', '.join(problems)))
 
     @property
     def parameters(self):
-        p = self.properties.get('parameters', {})
-        p = {k: str(v) for k, v in p.items()}
-        return p
+        """The parameter values, with the references to the outputs and
+        exports of other stacks resolved."""
+        if not hasattr(self, '_parameters'):
+            p = self.properties.get('parameters') or {}
+            self._parameters = {
+                k: self.outputs.resolve(v) for k, v in p.items()}
+        return self._parameters
+
+    @property
+    def depends_on(self):
+        """The stacks listed in depends_on or referenced by parameters."""
+        if self.path is None:
+            return []
+        names = list(self.properties.get('depends_on', []))
+        for value in (self.properties.get('parameters') or {}).values():
+            name = value.get('stack') if isinstance(value, dict) else None
+            if name and name not in names:
+                names.append(name)
+        return names
 
     def __str__(self):
         return '<Stack %s: %s>' % (self.name, self.template_path)
 
     def create(self):
+        self.check()
         response = self.client.create_stack(
             name=self.name,
             template=self.template_body,
@@ -78,6 +175,7 @@ class Stack(object):
         return response
 
     def update(self):
+        self.check()
         response = self.client.update_stack(
             name=self.name,
             template=self.template_body,
@@ -86,6 +184,60 @@ class Stack(object):
         )
         return response
 
+    def fingerprint(self):
+        return fingerprint(self.template_body, self.parameters)
+
+    def deployed_fingerprint(self):
+        template = self.client.get_template(name=self.name)
+        description = self.client.describe_stack(name=self.name)
+        parameters = {
+            p['ParameterKey']: p.get('ParameterValue')
+            for p in description.get('Parameters', [])
+        }
+        return fingerprint(template, parameters)
+
+    def is_up_to_date(self):
+        return self.fingerprint() == self.deployed_fingerprint()
+
+    def create_change_set(self, timeout=300):
+        """Create a change set for an update, return it once computed.
+
+        Return None when the change set is empty (it is deleted).
+        """
+        self.check()
+        change_set_name = 'buddy-%d' % time.time()
+        self.client.create_change_set(
+            name=self.name,
+            change_set_name=change_set_name,
+            template=self.template_body,
+            parameters=self.parameters,
+            capabilities=['CAPABILITY_IAM'],
+        )
+
+        def poll():
+            change_set = self.client.describe_change_set(
+                name=self.name, change_set_name=change_set_name)
+            if change_set['Status'] in ('CREATE_COMPLETE', 'FAILED'):
+                return change_set
+
+        change_set = Waiter(timeout, CHANGE_SET_BACKOFF,
+                            name='change-set').wait(poll)
+        if change_set is None:
+            raise StackError('Change set %s not ready after %ss' % (
+                change_set_name, timeout))
+        if change_set['Status'] == 'FAILED':
+            reason = change_set.get('StatusReason', '')
+            if any(r in reason for r in EMPTY_CHANGE_SET_REASONS):
+                self.client.delete_change_set(
+                    name=self.name, change_set_name=change_set_name)
+                return None
+            raise StackError('Change set failed: %s' % reason)
+        return change_set
+
+    def execute_change_set(self, change_set):
+        return self.client.execute_change_set(
+            name=self.name, change_set_name=change_set['ChangeSetName'])
+
     def delete(self, retain_resources=None):
         self.client.delete_stack(
             name=self.name, retain_resources=retain_resources
@@ -96,6 +248,9 @@ class Stack(object):
         response = self.client.describe_stack_events(name=self.name)
         return response
 
+    def iter_events(self, since=None):
+        return self.client.iter_stack_events(name=self.name, since=since)
+
     @property
     def status(self):
         response = self.client.describe_stack(name=self.name)
@@ -107,28 +262,157 @@ class Stack(object):
         return response
 
 
-def echo_response(mapping):
-    m = [[k, v] for k, v in mapping.items() if k != 'ResponseMetadata']
-    click.echo(tabulate(m))
+class StackEventTail(object):
+    """Fetch only the stack events that are newer than the last poll."""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.stack_id = name
+        self.cursor = None
+        self.newest = None
+
+    def start(self, backlog=0):
+        """Set the cursor on the newest event, return the `backlog` last."""
+        events = self.client.iter_stack_events(self.stack_id)
+        events = list(islice(events, max(backlog, 1)))
+        self._advance(events)
+        return list(reversed(events[:backlog]))
+
+    def poll(self):
+        events = self.client.iter_stack_events(self.stack_id,
+                                               since=self.cursor)
+        events = list(events)
+        self._advance(events)
+        return list(reversed(events))
+
+    def _advance(self, events):
+        if events:
+            self.newest = events[0]
+            self.cursor = events[0]['EventId']
+            # Follow the stack id, the name is gone once the stack is deleted
+            self.stack_id = events[0]['StackId']
+
+    @staticmethod
+    def is_stack_event(event):
+        return event['PhysicalResourceId'] == event['StackId']
+
+    @classmethod
+    def is_final(cls, event):
+        return (
+            cls.is_stack_event(event) and
+            event['ResourceStatus'] in CfnClient.STACK_STATUS_TERMINAL
+        )
 
 
-def echo_table(sequence_of_dict, columns, filters=None, pager=False):
-    def filter_for(key):
-        default = human_date if 'time' in key.lower() else lambda x: x
-        return (filters or {}).get(key, default)
-    data = [
-        [filter_for(column)(element.get(column)) for column in columns]
-        for element in sequence_of_dict
-    ]
-    output = tabulate(data, headers=columns)
-    if pager:
-        click.echo_via_pager(output)
-    else:
-        click.echo(output)
+FOLLOW_BACKOFF = Backoff(initial=2, factor=1.2, maximum=10, jitter=0.1)
+
+
+def follow_events(tail, on_event, timeout, backoff=FOLLOW_BACKOFF):
+    """Tail the stack events until the stack reaches a terminal status.
+
+    Return the final stack event, or None on timeout.
+    """
+    def poll():
+        final = None
+        for event in tail.poll():
+            on_event(event)
+            if tail.is_final(event):
+                final = event
+        return final
 
+    return Waiter(timeout, backoff, name='stack-events').wait(poll)
 
-def human_date(date):
-    return arrow.get(date).humanize()
+
+class StackOperationWatcher(object):
+    """Follow a stack operation and time each resource it touched."""
+
+    def __init__(self, client, name):
+        self.tail = StackEventTail(client, name)
+        self.events = []
+        self.final_event = None
+
+    def start(self):
+        """Skip the history of an existing stack, call before the operation."""
+        self.tail.start()
+
+    def wait(self, timeout, on_event=None):
+        def record(event):
+            self.events.append(event)
+            if on_event:
+                on_event(event)
+
+        self.final_event = follow_events(self.tail, record, timeout=timeout)
+        return self.final_event
+
+    @property
+    def final_status(self):
+        if self.final_event:
+            return self.final_event['ResourceStatus']
+
+    @property
+    def succeeded(self):
+        status = self.final_status
+        return bool(status) and status.endswith('_COMPLETE') and (
+            'ROLLBACK' not in status
+        )
+
+    def durations(self):
+        """Return (resource id, type, last status, seconds), slowest first."""
+        resources = {}
+        for event in self.events:
+            key = event['LogicalResourceId']
+            if key not in resources:
+                resources[key] = [event, event]
+            resources[key][1] = event
+
+        rows = [
+            (key, last['ResourceType'], last['ResourceStatus'],
+             (last['Timestamp'] - first['Timestamp']).total_seconds())
+            for key, (first, last) in resources.items()
+        ]
+        return sorted(rows, key=lambda r: r[3], reverse=True)
+
+
+def wait_for_operation(watcher, timeout, echo=click.echo):
+    final = watcher.wait(timeout, on_event=lambda e: echo(format_event(e)))
+
+    echo()
+    echo(tabulate(
+        watcher.durations(),
+        headers=['LogicalResourceId', 'ResourceType', 'ResourceStatus',
+                 'Duration (s)'],
+    ))
+
+    if final is None:
+        raise click.ClickException(
+            'Stack operation still in progress after %ss' % timeout)
+    if not watcher.succeeded:
+        raise click.ClickException(
+            'Stack operation failed: %s' % watcher.final_status)
+
+
+def format_event(event):
+    import arrow
+    return '%s  %-40s %-30s %s' % (
+        arrow.get(event['Timestamp']).to('local').format('HH:mm:ss'),
+        event['LogicalResourceId'],
+        event['ResourceStatus'],
+        event.get('ResourceStatusReason') or '',
+    )
+
+
+def echo_response(mapping, echo=click.echo, output='table'):
+    echo_mapping(mapping, output=output, echo=echo)
+
+
+def echo_table(sequence_of_dict, columns, filters=None, pager=False,
+               echo=click.echo, output='table'):
+    rows = (
+        [format_value(column, element.get(column), output, filters)
+         for column in columns]
+        for element in sequence_of_dict
+    )
+    echo_rows(rows, columns, output=output, pager=pager, echo=echo)
 
 
 class HandleBotoError(object):
@@ -136,59 +420,386 @@ class HandleBotoError(object):
         pass
 
     def __exit__(self, type, value, traceback):
+        if type is None:
+            return
+        import botocore.exceptions
         if type is botocore.exceptions.ClientError:
             raise click.ClickException(str(value))
+        if type in (StackError, TemplateError, OutputError):
+            raise click.ClickException(str(value))
+
+
+AGE_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days',
+             'w': 'weeks'}
+
+
+def parse_age(value):
+    """Parse an age like '90m', '12h' or '7d' into a timedelta."""
+    match = re.match(r'^(\d+)([smhdw])$', value or '')
+    if not match:
+        raise ValueError('Invalid age %r (e.g. 90m, 12h, 7d)' % value)
+    return timedelta(**{AGE_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def parse_tag(value):
+    key, _, tag_value = value.partition('=')
+    return key, tag_value if _ else None
+
+
+class StackFilter(object):
+    """Select stacks, from their summaries or descriptions.
+
+    `tags` maps keys to the expected value (None for any value) and needs
+    descriptions, summaries don't have the tags. Ages are compared to the
+    creation time.
+    """
+
+    def __init__(self, prefix=None, pattern=None, statuses=None, tags=None,
+                 older_than=None, newer_than=None, nested=True, now=None):
+        self.prefix = prefix
+        self.pattern = re.compile(pattern) if pattern else None
+        self.statuses = set(statuses or [])
+        self.tags = tags or {}
+        self.older_than = older_than
+        self.newer_than = newer_than
+        self.nested = nested
+        self.now = now or datetime.now(timezone.utc)
+
+    def _tags_match(self, stack):
+        tags = {t['Key']: t['Value'] for t in stack.get('Tags', [])}
+        return all(
+            key in tags and (value is None or tags[key] == value)
+            for key, value in self.tags.items()
+        )
+
+    def __call__(self, stack):
+        name = stack['StackName']
+        created = stack['CreationTime']
+        return (
+            (not self.prefix or name.startswith(self.prefix)) and
+            (not self.pattern or self.pattern.search(name)) and
+            (not self.statuses or stack['StackStatus'] in self.statuses) and
+            (self.nested or not stack.get('ParentId')) and
+            (not self.older_than or created <= self.now - self.older_than) and
+            (not self.newer_than or created >= self.now - self.newer_than) and
+            (not self.tags or self._tags_match(stack))
+        )
+
+
+def format_pairs(key, value):
+    def format(items):
+        return ', '.join('%s=%s' % (i[key], i[value]) for i in items or [])
+    return format
+
+
+STACK_FILE_PATTERNS = ['*.yaml', '*.yml']
+TEMPLATE_FILE_PATTERNS = ['*.yaml', '*.yml', '*.json', '*.template']
+
+
+def expand_paths(args, patterns=STACK_FILE_PATTERNS, accept=None):
+    """Expand directories and globs, keep the other arguments as is.
+
+    Files found by an expansion are kept only if accept(path) is true.
+    """
+    paths = []
+    for arg in args:
+        accept_all = False
+        if os.path.isdir(arg):
+            found = sorted(
+                path
+                for pattern in patterns
+                for path in glob.glob(os.path.join(arg, pattern))
+            )
+        elif glob.has_magic(arg):
+            found = sorted(glob.glob(arg))
+        else:
+            found = [arg]
+            accept_all = True
+        if accept is not None and not accept_all:
+            found = [path for path in found if accept(path)]
+        paths.extend(path for path in found if path not in paths)
+    if not paths:
+        raise click.ClickException('No file matching: %s' % ' '.join(args))
+    return paths
+
+
+def stack_paths(args):
+    """Expand the arguments to stack files, skipping the templates (and
+    other YAML files) found in the same directories."""
+    return expand_paths(args, accept=is_stack_file)
+
+
+def is_bulk(args, paths):
+    return list(args) != paths or len(paths) > 1
+
+
+def is_stack_file(path):
+    import yaml
+    try:
+        with open(path) as fp:
+            data = yaml.safe_load(fp)
+    except yaml.YAMLError:
+        return False
+    return isinstance(data, dict) and 'template' in data and (
+        'Resources' not in data
+    )
+
+
+def template_for(client, path, cache=None):
+    if is_stack_file(path):
+        path = Stack(client, path).template_path
+    return Template(client, path, cache=cache)
+
+
+def run_bulk(items, operation, parallel, label=str, depends_on=None,
+             output='table'):
+    """Run operation(item, echo) concurrently, show a table of results."""
+    results = run_parallel(
+        lambda item: operation(item, Echo(label(item))),
+        items, parallel, depends_on=depends_on,
+    )
+
+    rows = []
+    for item, result, error in results:
+        if error is None:
+            rows.append([label(item), 'ok', result])
+        else:
+            if isinstance(error, click.ClickException):
+                error = error.format_message()
+            rows.append([label(item), 'failed', error])
+
+    if output == 'table':
+        click.echo()
+    echo_rows(rows, ['Name', 'Result', 'Detail'], output=output)
+
+    failed = sum(1 for row in rows if row[1] == 'failed')
+    if failed:
+        raise click.ClickException('%s/%s failed' % (failed, len(rows)))
+
+
+def run_stacks(stacks, operation, parallel, output='table'):
+    by_name = {stack.name: stack for stack in stacks}
+    return run_bulk(
+        stacks, operation, parallel,
+        label=lambda stack: stack.name,
+        depends_on=lambda stack: [
+            by_name[name] for name in stack.depends_on if name in by_name
+        ],
+        output=output,
+    )
+
+
+def required_stacks(stacks):
+    return set(name for stack in stacks for name in stack.depends_on)
+
+
+def create_stack(stack, echo, wait, timeout):
+    response = stack.create()
+    echo_response(response, echo)
+    if wait:
+        watcher = StackOperationWatcher(stack.client, stack.name)
+        wait_for_operation(watcher, timeout, echo)
+    # Stacks referencing this one must see its new outputs
+    stack.outputs.forget(stack.name)
+    return response['StackId']
+
+
+def update_stack(stack, echo, wait, timeout, change_set, yes):
+    watcher = StackOperationWatcher(stack.client, stack.name)
+    if change_set:
+        change_set = plan_update(stack, echo)
+        if change_set is None:
+            return 'no changes'
+        if not (yes or click.confirm('Execute the change set?')):
+            return 'change set not executed'
+    if wait:
+        watcher.start()
+    if change_set:
+        response = stack.execute_change_set(change_set)
+    else:
+        response = stack.update()
+    echo_response(response, echo)
+    if wait:
+        wait_for_operation(watcher, timeout, echo)
+    stack.outputs.forget(stack.name)
+    return 'updated'
 
 
 # Commands
 
 
 @click.group()
-def cli():  # pragma: no cover
-    pass
+@click.option('--profile', is_flag=True,
+              help='Print a summary of the AWS calls and waits')
+@click.option('--trace', 'trace_path', metavar='FILE',
+              help='Write every AWS call and wait to FILE (JSON lines)')
+@click.pass_context
+def cli(ctx, profile, trace_path):
+    start_tracing(ctx, profile, trace_path)
+
+
+no_check_option = click.option(
+    '--no-check', is_flag=True,
+    help='Skip the local template checks, leave them to CloudFormation')
+
+
+def age_option(ctx, param, value):
+    try:
+        return parse_age(value) if value else None
+    except ValueError as err:
+        raise click.BadParameter(str(err))
 
 
 @cli.command(name='list')
+@click.option('--prefix', help='Only the stacks whose name starts with it')
+@click.option('--match', 'pattern', help='Only the stacks whose name '
+              'matches this regular expression')
+@click.option('--status', 'statuses', multiple=True,
+              type=click.Choice(CfnClient.STACK_STATUS_ACTIVE))
+@click.option('--tag', 'tags', multiple=True, metavar='KEY[=VALUE]',
+              help='Only the stacks with this tag (implies --describe)')
+@click.option('--older-than', callback=age_option, metavar='AGE',
+              help='Created more than AGE ago (e.g. 90m, 12h, 7d)')
+@click.option('--newer-than', callback=age_option, metavar='AGE')
+@click.option('--nested/--no-nested', default=True, show_default=True)
+@click.option('--limit', type=int, help='Stop after LIMIT stacks')
+@click.option('--describe', is_flag=True,
+              help='Read full descriptions, with tags and outputs')
+@output_option
+@click.option('--fresh', is_flag=True, help='Ignore the state cache')
 @handle_exception
-def _list():
-    client = CfnClient()
+def _list(prefix, pattern, statuses, tags, older_than, newer_than, nested,
+          limit, describe, output, fresh):
+    client = CfnClient(state_cache=get_state_cache(fresh))
+    try:
+        selected = StackFilter(
+            prefix=prefix, pattern=pattern, statuses=statuses,
+            tags=dict(parse_tag(t) for t in tags), older_than=older_than,
+            newer_than=newer_than, nested=nested)
+    except re.error as err:
+        raise click.BadParameter(str(err), param_hint='--match')
+
     columns = ['StackName', 'CreationTime', 'LastUpdatedTime', 'StackStatus']
+    filters = {}
+    if describe or tags:
+        # Tags and outputs come in the same pages as the stacks
+        stacks = client.describe_stacks()
+        columns += ['Tags', 'Outputs']
+        filters = {'Tags': format_pairs('Key', 'Value'),
+                   'Outputs': format_pairs('OutputKey', 'OutputValue')}
+    else:
+        # Only the status is filtered by the API
+        stacks = client.list_stacks(
+            status_filter=list(statuses) or client.STACK_STATUS_ACTIVE)
+
+    # The generators stop fetching pages once `limit` stacks are found
+    stacks = islice(filter(selected, stacks), limit)
     with HandleBotoError():
-        echo_table(
-            client.list_stacks(status_filter=client.STACK_STATUS_ACTIVE),
-            columns=columns,
-            filters={'CreationTime': human_date, 'LastUpdatedTime': human_date}
-        )
+        echo_table(stacks, columns=columns, filters=filters, output=output)
+
+
+def plan_update(stack, echo=click.echo):
+    if stack.is_up_to_date():
+        echo('No changes: %s' % stack.name)
+        return None
+
+    change_set = stack.create_change_set()
+    if change_set is None:
+        echo('No changes: %s' % stack.name)
+        return None
+
+    echo_table(
+        [c['ResourceChange'] for c in change_set['Changes']
+         if c.get('Type') == 'Resource'],
+        columns=['Action', 'LogicalResourceId', 'ResourceType',
+                 'Replacement'],
+        echo=echo,
+    )
+    return change_set
 
 
 @cli.command()
-@click.argument('stack')
+@click.argument('stacks', nargs=-1, required=True)
+@click.option('--wait', is_flag=True)
+@click.option('--timeout', default=3600, show_default=True)
+@click.option('--parallel', default=4, show_default=True)
+@no_check_option
 @handle_exception
-def create(stack):
+def create(stacks, wait, timeout, parallel, no_check):
     client = CfnClient()
-    stack = Stack(client, stack)
-    with HandleBotoError():
-        response = stack.create()
-    echo_response(response)
+    paths = stack_paths(stacks)
+    bulk = is_bulk(stacks, paths)
+    stacks = [Stack(client, path, skip_check=no_check) for path in paths]
+
+    if not bulk:
+        with HandleBotoError():
+            create_stack(stacks[0], Echo(), wait, timeout)
+        return
+
+    required = required_stacks(stacks)
+
+    def operation(stack, echo):
+        with HandleBotoError():
+            return create_stack(stack, echo, wait or stack.name in required,
+                                timeout)
+
+    run_stacks(stacks, operation, parallel)
 
 
 @cli.command()
-@click.argument('stack')
+@click.argument('stacks', nargs=-1, required=True)
+@click.option('--wait', is_flag=True)
+@click.option('--timeout', default=3600, show_default=True)
+@click.option('--change-set', is_flag=True)
+@click.option('--yes', is_flag=True)
+@click.option('--parallel', default=4, show_default=True)
+@no_check_option
 @handle_exception
-def update(stack):
+def update(stacks, wait, timeout, change_set, yes, parallel, no_check):
     client = CfnClient()
-    stack = Stack(client, stack)
-    with HandleBotoError():
-        response = stack.update()
-    echo_response(response)
+    paths = stack_paths(stacks)
+    bulk = is_bulk(stacks, paths)
+    stacks = [Stack(client, path, skip_check=no_check) for path in paths]
+
+    if not bulk:
+        with HandleBotoError():
+            update_stack(stacks[0], Echo(), wait, timeout, change_set, yes)
+        return
+
+    if change_set and not yes:
+        raise click.ClickException(
+            '--yes is required to update several stacks with change sets')
+
+    required = required_stacks(stacks)
+
+    def operation(stack, echo):
+        with HandleBotoError():
+            return update_stack(stack, echo, wait or stack.name in required,
+                                timeout, change_set, yes)
+
+    run_stacks(stacks, operation, parallel)
 
 
 @cli.command()
 @click.argument('stack')
+@click.option('--limit', type=int)
+@click.option('--follow', is_flag=True)
+@click.option('--timeout', default=3600, show_default=True)
+@output_option
 @handle_exception
-def events(stack):
+def events(stack, limit, follow, timeout, output):
     client = CfnClient()
     stack = Stack(client, stack)
+    if follow:
+        tail = StackEventTail(client, stack.name)
+        with HandleBotoError():
+            for event in tail.start(backlog=limit or 10):
+                click.echo(format_event(event))
+            if not (tail.newest and tail.is_final(tail.newest)):
+                follow_events(tail, lambda e: click.echo(format_event(e)),
+                              timeout=timeout)
+        return
+
     columns = [
         'LogicalResourceId',
         'ResourceStatus',
@@ -197,27 +808,42 @@ def events(stack):
     ]
     with HandleBotoError():
         echo_table(
-            stack.events,
+            islice(stack.iter_events(), limit),
             columns=columns,
-            filters={'Timestamp': human_date},
-            pager=True,
+            pager=limit is None,
+            output=output,
         )
 
 
 @cli.command()
-@click.argument('stack')
+@click.argument('stacks', nargs=-1, required=True)
+@click.option('--parallel', default=4, show_default=True)
+@output_option
+@click.option('--fresh', is_flag=True, help='Ignore the state cache')
 @handle_exception
-def show(stack):
-    client = CfnClient()
-    stack = Stack(client, stack)
-    echo_response(stack.status)
+def show(stacks, parallel, output, fresh):
+    client = CfnClient(state_cache=get_state_cache(fresh))
+    paths = stack_paths(stacks)
+    if not is_bulk(stacks, paths):
+        with HandleBotoError():
+            echo_response(Stack(client, paths[0]).status, output=output)
+        return
+
+    def operation(stack, echo):
+        with HandleBotoError():
+            return stack.status['StackStatus']
+
+    run_stacks([Stack(client, path) for path in paths], operation, parallel,
+               output=output)
 
 
 @cli.command()
 @click.argument('stack')
+@output_option
+@click.option('--fresh', is_flag=True, help='Ignore the state cache')
 @handle_exception
-def resources(stack):
-    client = CfnClient()
+def resources(stack, output, fresh):
+    client = CfnClient(state_cache=get_state_cache(fresh))
     stack = Stack(client, stack)
     columns = [
         'ResourceType',
@@ -231,18 +857,40 @@ def resources(stack):
             stack.resources,
             columns=columns,
             pager=True,
+            output=output,
         )
 
 
 @cli.command()
-@click.argument('template-file')
+@click.argument('template-files', nargs=-1, required=True)
+@click.option('--parallel', default=4, show_default=True)
+@click.option('--no-cache', is_flag=True)
+@output_option
 @handle_exception
-def validate(template_file):
+def validate(template_files, parallel, no_cache, output):
     client = CfnClient()
-    template = Template(client, template_file)
-    with HandleBotoError():
-        response = template.validate()
-    echo_response(response)
+    cache = None if no_cache else validation_cache()
+    paths = expand_paths(template_files, patterns=TEMPLATE_FILE_PATTERNS)
+    if not is_bulk(template_files, paths):
+        template = template_for(client, paths[0], cache=cache)
+        with HandleBotoError():
+            response = template.validate()
+        echo_response(response, output=output)
+        return
+
+    templates = []
+    for path in paths:
+        template = template_for(client, path, cache=cache)
+        if template.path not in [t.path for t in templates]:
+            templates.append(template)
+
+    def operation(template, echo):
+        with HandleBotoError():
+            template.validate()
+        return 'valid'
+
+    run_bulk(templates, operation, parallel, label=lambda t: t.path,
+             output=output)
 
 
 @cli.command()
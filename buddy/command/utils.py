@@ -1,16 +1,99 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+import threading
+import time
+
 import click
 
+from buddy import trace
+
+
+class Echo(object):
+    """Print blocks of lines atomically, optionally prefixed (thread-safe)."""
+
+    lock = threading.RLock()
+
+    def __init__(self, prefix=None, err=False):
+        self.prefix = prefix
+        self.err = err
+
+    def __call__(self, s='', **style):
+        lines = str(s).splitlines() or ['']
+        if self.prefix:
+            lines = ['[%s] %s' % (self.prefix, line) for line in lines]
+        with self.lock:
+            click.secho('\n'.join(lines), err=self.err, **style)
+
+    def step(self, s):
+        self(s, fg='green', bold=True)
+
+    def action(self, s):
+        self(s, fg='yellow', bold=True)
+
+    def error(self, s):
+        self(s, fg='red', bold=True)
+
+
+_echo = Echo()
+
 
 def echo_step(s):
-    click.secho(s, fg='green', bold=True)
+    _echo.step(s)
 
 
 def echo_action(s):
-    click.secho(s, fg='yellow', bold=True)
+    _echo.action(s)
 
 
 def echo_error(s):
-    click.secho(s, fg='red', bold=True)
+    _echo.error(s)
+
+
+def tabulate(*args, **kwargs):
+    from tabulate import tabulate  # slow to import
+    return tabulate(*args, **kwargs)
+
+
+def human_date(date):
+    """Return e.g. '3 hours ago', memoized for tables with many dates."""
+    if date is None:
+        return ''
+    # Cached by minute so that long running commands (--watch) stay exact
+    return _humanize(date, int(time.time() // 60))
+
+
+@lru_cache(maxsize=4096)
+def _humanize(date, minute):
+    import arrow  # slow to import
+    return arrow.get(date).humanize()
+
+
+def start_tracing(ctx, profile=False, trace_path=None):
+    """Record the AWS calls and waits of the command being run.
+
+    With `profile`, a summary is printed (on stderr) when the command ends.
+    With `trace_path`, every call and wait is written to it as JSON lines.
+    """
+    if not (profile or trace_path):
+        return
+    trace_file = open(trace_path, 'w') if trace_path else None
+    tracer = trace.Tracer(trace_file)
+    trace.set_tracer(tracer)
+
+    def stop():
+        trace.set_tracer(None)
+        if trace_file is not None:
+            trace_file.close()
+        if profile:
+            from buddy.client import get_throttle
+            counters = get_throttle().counters
+            click.echo(tabulate(tracer.summary(),
+                                headers=tracer.SUMMARY_HEADERS), err=True)
+            click.echo('Throttled: %(throttles)s, retries: %(retries)s '
+                       '(refused: %(refused)s), rate limited: %(waited).1fs'
+                       % counters, err=True)
+
+    ctx.call_on_close(stop)
 
 
 def failure(s, exit_code=1):
@@ -19,3 +102,75 @@ def failure(s, exit_code=1):
     exc = click.ClickException(s)
     exc.exit_code = exit_code
     raise exc
+
+
+class DependencyError(Exception):
+    pass
+
+
+def _requirements(items, depends_on):
+    """Return, for each item, the positions of the items it depends on."""
+    position = {id(item): n for n, item in enumerate(items)}
+    return [
+        [position[id(d)] for d in (depends_on(item) if depends_on else ())
+         if id(d) in position and d is not item]
+        for item in items
+    ]
+
+
+def _schedule(submit, items, requires, pending, results):
+    """Submit the pending items whose dependencies succeeded, fail those
+    whose dependencies failed. Repeat until nothing changes."""
+    scheduled = True
+    while scheduled:
+        scheduled = False
+        for n in list(pending):
+            failed = [d for d in requires[n]
+                      if d in results and results[d][1] is not None]
+            if failed:
+                results[n] = (None, DependencyError('Dependency failed: %s' % (
+                    ', '.join(str(items[d]) for d in failed))))
+            elif all(d in results for d in requires[n]):
+                submit(n)
+            else:
+                continue
+            pending.remove(n)
+            scheduled = True
+
+
+def run_parallel(fn, items, workers, depends_on=None):
+    """Call fn on every item using at most `workers` threads.
+
+    `depends_on(item)` returns the items that must succeed before `item`
+    is started. Items whose dependencies failed (or form a cycle) are not
+    run, their error is a DependencyError.
+
+    Return a list of (item, result, error) in the order of `items`.
+    """
+    def call(item):
+        try:
+            return fn(item), None
+        except Exception as exc:
+            return None, exc
+
+    items = list(items)
+    requires = _requirements(items, depends_on)
+    results = {}
+    pending = list(range(len(items)))
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        def submit(n):
+            running[pool.submit(call, items[n])] = n
+
+        while pending or running:
+            _schedule(submit, items, requires, pending, results)
+            if not running:
+                for n in pending:
+                    results[n] = (None, DependencyError('Dependency cycle'))
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+    return [(item,) + results[n] for n, item in enumerate(items)]
@@ -1,23 +1,26 @@
 from functools import wraps
 
-import botocore.exceptions
-
 from click import ClickException
 
 
+# Class paths, not classes: botocore is not imported just to define them
 EXC_TO_ECHO = [
-    botocore.exceptions.NoRegionError,
-    botocore.exceptions.ParamValidationError,
+    'botocore.exceptions.NoRegionError',
+    'botocore.exceptions.ParamValidationError',
 ]
 
 
+def _class_path(cls):
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
 def handle_exception(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
         except Exception as exc:
-            if exc.__class__ in EXC_TO_ECHO:
+            if _class_path(exc.__class__) in EXC_TO_ECHO:
                 msg = '%s: %s' % (exc.__class__, exc)
                 raise ClickException(msg)
             raise
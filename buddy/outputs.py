@@ -0,0 +1,101 @@
+import threading
+import weakref
+
+
+class OutputError(Exception):
+    pass
+
+
+def reference(value):
+    """Return ('stack', name, key), ('export', name) or None for a literal.
+
+    References are written {stack: name, output: key} or {export: name}.
+    """
+    if not isinstance(value, dict):
+        return None
+    if sorted(value) == ['output', 'stack']:
+        return ('stack', str(value['stack']), str(value['output']))
+    if list(value) == ['export']:
+        return ('export', str(value['export']))
+    raise OutputError('Invalid reference %r, expected {stack: NAME, '
+                      'output: KEY} or {export: NAME}' % (value,))
+
+
+class OutputIndex(object):
+    """The outputs and exports of the deployed stacks.
+
+    They are read in bulk, with paginated DescribeStacks and ListExports
+    calls, the first time they are needed. Stacks missing from the index
+    (or forgotten because they were just changed) are described alone.
+    """
+
+    _indexes = weakref.WeakKeyDictionary()
+    _indexes_lock = threading.Lock()
+
+    def __init__(self, client):
+        self.client = client
+        self._outputs = None
+        self._exports = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def for_client(cls, client):
+        """Return the index shared by the users of a client."""
+        with cls._indexes_lock:
+            if client not in cls._indexes:
+                cls._indexes[client] = cls(client)
+            return cls._indexes[client]
+
+    @staticmethod
+    def _stack_outputs(stack):
+        return {o['OutputKey']: o['OutputValue']
+                for o in stack.get('Outputs', [])}
+
+    def output(self, stack_name, key):
+        with self._lock:
+            if self._outputs is None:
+                self._outputs = {
+                    stack['StackName']: self._stack_outputs(stack)
+                    for stack in self.client.describe_stacks()
+                }
+            if stack_name not in self._outputs:
+                stack = self._describe(stack_name)
+                self._outputs[stack_name] = self._stack_outputs(stack)
+            outputs = self._outputs[stack_name]
+        if key not in outputs:
+            raise OutputError('Stack %s has no output %s' % (stack_name, key))
+        return outputs[key]
+
+    def _describe(self, stack_name):
+        import botocore.exceptions
+        try:
+            return self.client.describe_stack(stack_name)
+        except botocore.exceptions.ClientError:
+            raise OutputError('Stack %s not found' % stack_name)
+
+    def export(self, name):
+        with self._lock:
+            if self._exports is None:
+                self._exports = {
+                    export['Name']: export['Value']
+                    for export in self.client.list_exports()
+                }
+            exports = self._exports
+        if name not in exports:
+            raise OutputError('Export %s not found' % name)
+        return exports[name]
+
+    def forget(self, stack_name):
+        """Read the outputs of a stack (and the exports) again next time."""
+        with self._lock:
+            if self._outputs is not None:
+                self._outputs.pop(stack_name, None)
+            self._exports = None
+
+    def resolve(self, value):
+        ref = reference(value)
+        if ref is None:
+            return str(value)
+        if ref[0] == 'stack':
+            return self.output(ref[1], ref[2])
+        return self.export(ref[1])
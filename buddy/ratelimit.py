@@ -0,0 +1,185 @@
+import functools
+import threading
+import time
+
+
+class TokenBucket(object):
+    """Allow `rate` calls per second with bursts of `burst`, across threads.
+
+    The rate is halved (down to `min_rate`) each time the service throttles
+    us, and recovers by a tenth of the maximum rate on each success.
+    """
+
+    def __init__(self, rate, burst=None, min_rate=0.5, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        elapsed = now - self._updated
+        self._updated = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+
+    def acquire(self):
+        """Take a token, waiting for it if needed. Return the time waited."""
+        with self._lock:
+            self._refill()
+            # Tokens go negative when callers queue up for future tokens
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay > 0:
+            self.sleep(delay)
+        return delay
+
+    def throttled(self):
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill()
+                self.rate = min(self.max_rate,
+                                self.rate + self.max_rate / 10)
+
+
+class RetryBudget(object):
+    """A number of retries shared by all the calls of the process.
+
+    Each retry spends one, each successful call gives back `refill`.
+    """
+
+    def __init__(self, capacity, refill=0.1):
+        self.capacity = capacity
+        self.refill = refill
+        self.available = float(capacity)
+        self._lock = threading.Lock()
+
+    def spend(self):
+        with self._lock:
+            if self.available < 1:
+                return False
+            self.available -= 1
+            return True
+
+    def succeeded(self):
+        with self._lock:
+            self.available = min(self.capacity, self.available + self.refill)
+
+
+THROTTLING_CODES = frozenset([
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'SlowDown',
+])
+
+
+class ApiThrottle(object):
+    """Rate limit the API calls of botocore clients, per operation.
+
+    Installed on clients, it takes a token before each HTTP request (retries
+    included), slows an operation down when it gets throttled and stops
+    retrying once the shared retry budget is spent.
+
+    `counters` holds the number of calls, throttles, retries, retries
+    refused, and the seconds spent waiting for tokens.
+    """
+
+    def __init__(self, rates=None, default_rate=20.0, retry_budget=100,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rates = rates or {}
+        self.default_rate = default_rate
+        self.budget = RetryBudget(retry_budget)
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = {}
+        self.counters = dict.fromkeys(
+            ['calls', 'throttles', 'retries', 'refused'], 0)
+        self.counters['waited'] = 0.0
+        self._lock = threading.Lock()
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def bucket(self, service, operation):
+        key = (service, operation)
+        with self._lock:
+            if key not in self.buckets:
+                rate = self.rates.get(service, self.default_rate)
+                self.buckets[key] = TokenBucket(rate, clock=self.clock,
+                                                sleep=self.sleep)
+            return self.buckets[key]
+
+    @staticmethod
+    def max_attempts(client):
+        """The number of attempts botocore makes for a call of a client."""
+        retries = client.meta.config.retries or {}
+        if 'total_max_attempts' in retries:
+            return retries['total_max_attempts']
+        # The defaults of the retry modes (legacy: 4 retries, others: 2)
+        return 5 if retries.get('mode', 'legacy') == 'legacy' else 3
+
+    def install(self, client):
+        service = client.meta.service_model.service_id.hyphenize()
+        events = client.meta.events
+        events.register_first('before-send.%s' % service, self.before_send)
+        events.register_first(
+            'needs-retry.%s' % service,
+            functools.partial(self.needs_retry,
+                              max_attempts=self.max_attempts(client)))
+        events.register('after-call.%s' % service, self.after_call)
+
+    @staticmethod
+    def _operation(event_name):
+        _, service, operation = event_name.split('.', 2)
+        return service, operation
+
+    def before_send(self, event_name, **kwargs):
+        waited = self.bucket(*self._operation(event_name)).acquire()
+        self._count('calls')
+        if waited:
+            self._count('waited', waited)
+
+    def needs_retry(self, event_name, response=None, caught_exception=None,
+                    attempts=1, max_attempts=None, **kwargs):
+        """Called before botocore decides to retry: adapt the rate to
+        throttles and spend the budget for the retries it will make."""
+        if caught_exception is None:
+            http, parsed = response
+            code = parsed.get('Error', {}).get('Code')
+            if code in THROTTLING_CODES:
+                self._count('throttles')
+                self.bucket(*self._operation(event_name)).throttled()
+            elif http.status_code < 500:
+                return
+
+        if max_attempts is not None and attempts >= max_attempts:
+            return  # The last attempt, botocore gives up
+
+        if not self.budget.spend():
+            self._count('refused')
+            if caught_exception is not None:
+                raise caught_exception
+            from botocore.exceptions import ClientError
+            raise ClientError(parsed, self._operation(event_name)[1])
+        self._count('retries')
+
+    def after_call(self, event_name, http_response=None, **kwargs):
+        if http_response is not None and http_response.status_code < 300:
+            self.bucket(*self._operation(event_name)).succeeded()
+            self.budget.succeeded()
@@ -0,0 +1,140 @@
+import hashlib
+import json
+
+
+TOP_LEVEL_SECTIONS = [
+    'AWSTemplateFormatVersion',
+    'Description',
+    'Metadata',
+    'Parameters',
+    'Rules',
+    'Mappings',
+    'Conditions',
+    'Transform',
+    'Hooks',
+    'Resources',
+    'Outputs',
+]
+
+
+class TemplateError(Exception):
+    pass
+
+
+def _construct_tag(loader, tag_suffix, node):
+    import yaml
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+
+    if tag_suffix == 'Ref':
+        return {'Ref': value}
+    if tag_suffix == 'GetAtt' and isinstance(value, str):
+        value = value.split('.', 1)
+    return {'Fn::%s' % tag_suffix: value}
+
+
+_cfn_loader = None
+
+
+def cfn_loader():
+    """Return a yaml loader that understands the short form functions."""
+    global _cfn_loader
+    if _cfn_loader is None:
+        import yaml
+
+        class CfnLoader(yaml.SafeLoader):
+            pass
+
+        CfnLoader.add_multi_constructor('!', _construct_tag)
+        _cfn_loader = CfnLoader
+    return _cfn_loader
+
+
+def template_hash(body):
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def parse_template(body):
+    """Parse a JSON or YAML template, short form functions included."""
+    try:
+        return json.loads(body)
+    except ValueError:
+        pass
+    import yaml
+    try:
+        return yaml.load(body, Loader=cfn_loader())
+    except yaml.YAMLError as err:
+        raise TemplateError('Invalid template: %s' % err)
+
+
+def _references(node):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'Ref' and isinstance(value, str):
+                yield value
+            elif (key == 'Fn::GetAtt' and isinstance(value, list) and
+                    value and isinstance(value[0], str)):
+                yield value[0]
+            else:
+                for ref in _references(value):
+                    yield ref
+    elif isinstance(node, list):
+        for value in node:
+            for ref in _references(value):
+                yield ref
+
+
+def check_template(body, parameters=None):
+    """Return the problems found in a template without calling AWS.
+
+    When `parameters` is given, also check them against the template.
+    """
+    try:
+        template = parse_template(body)
+    except TemplateError as err:
+        return [str(err)]
+    if not isinstance(template, dict):
+        return ['Invalid template: not a mapping']
+
+    # Macros can add sections, resources and parameters (e.g. SAM Globals),
+    # do not second-guess them
+    transformed = 'Transform' in template
+
+    problems = [
+        'Unknown top-level section: %s' % key
+        for key in template
+        if key not in TOP_LEVEL_SECTIONS and not transformed
+    ]
+    resources = template.get('Resources')
+    if not isinstance(resources, dict) or not resources:
+        problems.append('Missing Resources section')
+        resources = {}
+
+    declared = template.get('Parameters') or {}
+
+    if not transformed:
+        known = set(declared) | set(resources)
+        unresolved = sorted(set(
+            ref for ref in _references(resources) if ref not in known and
+            not ref.startswith('AWS::')
+        ) | set(
+            ref for ref in _references(template.get('Outputs') or {})
+            if ref not in known and not ref.startswith('AWS::')
+        ))
+        problems.extend('Unresolved reference: %s' % r for r in unresolved)
+
+    if parameters is not None:
+        problems.extend(
+            'Missing parameter: %s' % name
+            for name, spec in sorted(declared.items())
+            if name not in parameters and 'Default' not in (spec or {})
+        )
+        problems.extend(
+            'Unknown parameter: %s' % name
+            for name in sorted(parameters) if name not in declared
+        )
+    return problems
@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+from urllib.parse import urlencode
+
+
+# Request parameters carrying a pagination token
+PAGE_TOKENS = ('NextToken', 'nextToken', 'Marker', 'ContinuationToken')
+
+_tracer = None
+
+
+class Tracer(object):
+    """Record AWS calls and waits, as a summary and/or a JSON-lines trace.
+
+    Each record has a kind ('call' or 'wait'), a name (e.g.
+    'ecs.DescribeServices') and a duration, plus fields depending on the
+    kind: attempts, bytes sent, error code, pagination for the calls and
+    the number of polls for the waits.
+    """
+
+    def __init__(self, trace_file=None, clock=time.time):
+        self.trace_file = trace_file
+        self.clock = clock
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, duration, **fields):
+        with self._lock:
+            stats = self.stats.setdefault((kind, name), dict.fromkeys(
+                ['count', 'total', 'max', 'retries', 'pages', 'bytes',
+                 'errors'], 0))
+            stats['count'] += 1
+            stats['total'] += duration
+            stats['max'] = max(stats['max'], duration)
+            stats['retries'] += max(0, fields.get('attempts', 1) - 1)
+            stats['pages'] += 1 if fields.get('page') else 0
+            stats['bytes'] += fields.get('bytes', 0)
+            stats['errors'] += 1 if fields.get('error') else 0
+
+            if self.trace_file is not None:
+                line = dict(fields, time=self.clock(), kind=kind, name=name,
+                            duration=round(duration, 6),
+                            thread=threading.current_thread().name)
+                self.trace_file.write(json.dumps(line, sort_keys=True))
+                self.trace_file.write('\n')
+                self.trace_file.flush()
+
+    def summary(self):
+        """Return the rows of the summary, the slowest first."""
+        rows = [
+            [kind, name, s['count'], round(s['total'], 3),
+             round(s['max'], 3), s['retries'], s['pages'], s['bytes'],
+             s['errors']]
+            for (kind, name), s in self.stats.items()
+        ]
+        return sorted(rows, key=lambda row: row[3], reverse=True)
+
+    SUMMARY_HEADERS = ['Kind', 'Name', 'Count', 'Total (s)', 'Max (s)',
+                       'Retries', 'Pages', 'Bytes', 'Errors']
+
+
+def get_tracer():
+    return _tracer
+
+
+def set_tracer(tracer):
+    global _tracer
+    _tracer = tracer
+
+
+def record(kind, name, duration, **fields):
+    tracer = _tracer
+    if tracer is not None:
+        tracer.record(kind, name, duration, **fields)
+
+
+def _call_name(event_name):
+    return '.'.join(event_name.split('.')[1:3])
+
+
+def _before_parameter_build(params=None, context=None, **kwargs):
+    # The API parameters, before-call only sees the serialized request
+    if _tracer is not None and context is not None:
+        context['trace_page'] = any(params.get(k) for k in PAGE_TOKENS)
+
+
+def _before_call(context=None, **kwargs):
+    if _tracer is not None and context is not None:
+        context['trace'] = {
+            'start': time.monotonic(),
+            'bytes': 0,
+            'page': context.pop('trace_page', False),
+        }
+
+
+def _request_created(request=None, **kwargs):
+    trace = getattr(request, 'context', {}).get('trace')
+    if trace is None:
+        return
+    body = request.body
+    if isinstance(body, dict):  # query protocol, encoded when sent
+        body = urlencode(body, doseq=True)
+    if isinstance(body, (bytes, str)):
+        trace['bytes'] += len(body)
+
+
+def _after_call(event_name, context=None, parsed=None, exception=None,
+                **kwargs):
+    trace = (context or {}).pop('trace', None)
+    if trace is None:
+        return
+    if exception is not None:
+        error = exception.__class__.__name__
+    else:
+        error = (parsed or {}).get('Error', {}).get('Code')
+    record('call', _call_name(event_name),
+           time.monotonic() - trace['start'],
+           attempts=context.get('retries', {}).get('attempt', 1),
+           bytes=trace['bytes'], page=trace['page'], error=error)
+
+
+def install(client):
+    """Record the calls of a botocore client while a tracer is set."""
+    service = client.meta.service_model.service_id.hyphenize()
+    events = client.meta.events
+    events.register('before-parameter-build.%s' % service,
+                    _before_parameter_build)
+    events.register('before-call.%s' % service, _before_call)
+    events.register('request-created.%s' % service, _request_created)
+    events.register('after-call.%s' % service, _after_call)
+    events.register('after-call-error.%s' % service, _after_call)
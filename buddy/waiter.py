@@ -0,0 +1,63 @@
+import random
+import time
+
+from buddy import trace
+
+
+class Backoff(object):
+    def __init__(self, initial=1.0, factor=1.5, maximum=15.0, jitter=0.2):
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.jitter = jitter
+
+    def delays(self):
+        delay = self.initial
+        while True:
+            spread = delay * self.jitter
+            yield max(0.0, delay + random.uniform(-spread, spread))
+            delay = min(delay * self.factor, self.maximum)
+
+
+class Waiter(object):
+    """Poll until a condition is met, backing off up to a deadline.
+
+    `elapsed` and `attempts` record how the last wait went, the waits are
+    also traced under `name`.
+    """
+
+    def __init__(self, timeout, backoff=None, clock=time.monotonic,
+                 sleep=time.sleep, name='wait'):
+        self.name = name
+        self.timeout = timeout
+        self.backoff = backoff or Backoff()
+        self.clock = clock
+        self.sleep = sleep
+        self.elapsed = None
+        self.attempts = 0
+
+    def wait(self, poll):
+        """Call poll() until it returns a true value, which is returned.
+
+        Return None if the timeout expires first. The last poll happens
+        at the deadline.
+        """
+        start = self.clock()
+        deadline = start + self.timeout
+        delays = self.backoff.delays()
+        self.attempts = 0
+        result = None
+        try:
+            while True:
+                self.attempts += 1
+                result = poll()
+                if result:
+                    return result
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return None
+                self.sleep(min(next(delays), remaining))
+        finally:
+            self.elapsed = self.clock() - start
+            trace.record('wait', self.name, self.elapsed,
+                         attempts=self.attempts, timed_out=not result)
@@ -22,6 +22,10 @@ entry_points = {
         'bcluster = buddy.command.cluster:cli',
         'bstack = buddy.command.stack:cli',
     ],
+    'buddy.configurators': [
+        'cloudwatch_logs = '
+        'buddy.command.cluster.service:cloudwatch_log_configurator',
+    ],
 }
 
 
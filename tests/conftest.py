@@ -6,6 +6,8 @@ import moto
 import boto3
 import pytest
 
+from buddy.client import reset_clients
+
 
 @pytest.fixture(scope="session")
 def monkeypatch_session(request):
@@ -56,3 +58,29 @@ def stack():
 def mock_cloudformation():
     with moto.mock_cloudformation():
         yield
+
+
+@pytest.fixture
+def mock_ecs():
+    with moto.mock_ecs():
+        yield
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmpdir, monkeypatch):
+    path = tmpdir.join('cache')
+    monkeypatch.setenv('BUDDY_CACHE_DIR', str(path))
+    return path
+
+
+@pytest.fixture
+def mock_s3():
+    with moto.mock_s3():
+        yield
+
+
+@pytest.fixture(autouse=True)
+def aws_clients():
+    reset_clients()
+    yield
+    reset_clients()
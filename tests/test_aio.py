@@ -0,0 +1,134 @@
+import asyncio
+import gc
+import time
+
+from buddy.aio import AsyncClient, collect, run
+from buddy.cache import StateCache
+from buddy.client import CfnClient, EcsClient
+from conftest import TEST_TEMPLATE_BODY
+import boto3
+import pytest
+
+
+LATENCY = 0.05
+
+
+@pytest.fixture
+def services(mock_ecs):
+    boto = boto3.client('ecs')
+    boto.create_cluster(clusterName='cluster')
+    boto.register_task_definition(
+        family='hello',
+        containerDefinitions=[{'name': 'app', 'image': 'hello', 'memory': 1}],
+    )
+    names = ['service-%s' % i for i in range(8)]
+    for name in names:
+        boto.create_service(cluster='cluster', serviceName=name,
+                            taskDefinition='hello', desiredCount=0)
+    return names
+
+
+def slow_client():
+    client = EcsClient()
+    client.boto.meta.events.register(
+        'before-send.ecs', lambda **kwargs: time.sleep(LATENCY))
+    return client
+
+
+def test_same_methods(services):
+    client = AsyncClient(EcsClient())
+
+    async def main():
+        response = await client.describe_services('cluster', 'service-0')
+        arns = await collect(client.list_services('cluster'))
+        return response, arns
+
+    response, arns = run(main())
+    assert response['services'][0]['serviceName'] == 'service-0'
+    assert len(arns) == 8
+
+
+class Pages(object):
+    def generator(self):
+        yield 1
+        yield 2
+
+    def iterator(self):
+        return iter([3, 4])
+
+    def value(self):
+        return [5, 6]
+
+
+def test_iterate_over_results():
+    client = AsyncClient(Pages())
+
+    async def main():
+        items = []
+        for method in [client.generator, client.iterator, client.value]:
+            async for item in method():
+                items.append(item)
+        return items, await client.value()
+
+    assert run(main()) == ([1, 2, 3, 4, 5, 6], [5, 6])
+
+
+def test_cached_list(mock_cloudformation, tmpdir):
+    CfnClient().create_stack('stack', TEST_TEMPLATE_BODY, {}, [])
+    cache = StateCache(path=str(tmpdir.join('state.sqlite')))
+    client = AsyncClient(CfnClient(state_cache=cache))
+
+    async def names():
+        stacks = []
+        async for stack in client.list_stacks(['CREATE_COMPLETE']):
+            stacks.append(stack['StackName'])
+        return stacks
+
+    assert run(names()) == ['stack']
+    assert run(names()) == ['stack']  # from the cache
+
+
+def test_run_sets_the_current_loop():
+    async def current():
+        policy = asyncio.get_event_loop_policy()
+        return policy.get_event_loop(), asyncio.get_event_loop()
+
+    from_policy, from_asyncio = run(current())
+
+    assert from_policy is from_asyncio
+    assert from_policy.is_closed()
+
+
+def test_errors_are_raised(services):
+    client = AsyncClient(EcsClient())
+    with pytest.raises(Exception) as info:
+        run(client.describe_services('missing', 'service'))
+    assert 'ClusterNotFoundException' in str(info.value)
+
+
+def test_benchmark_against_sync(services):
+    client = slow_client()
+
+    # Keep a collection pause out of the timed sections
+    gc.collect()
+    start = time.monotonic()
+    for name in services:
+        client.describe_services('cluster', name)
+    sync_time = time.monotonic() - start
+
+    async_client = AsyncClient(client)
+
+    async def describe_all():
+        return await asyncio.gather(*[
+            async_client.describe_services('cluster', name)
+            for name in services
+        ])
+
+    gc.collect()
+    start = time.monotonic()
+    responses = run(describe_all())
+    async_time = time.monotonic() - start
+
+    assert len(responses) == len(services)
+    assert sync_time >= len(services) * LATENCY
+    assert async_time < sync_time / 2
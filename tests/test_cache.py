@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+import os
+import time
+
+from buddy.cache import cache_dir, FileCache, get_state_cache, StateCache
+
+
+def test_cache_dir(cache_dir):
+    assert FileCache('things').path == str(cache_dir.join('things'))
+
+
+def test_default_cache_dir(monkeypatch):
+    monkeypatch.delenv('BUDDY_CACHE_DIR')
+    monkeypatch.setenv('XDG_CACHE_HOME', '/xdg')
+    assert cache_dir('a') == '/xdg/buddy/a'
+
+
+def test_get_set():
+    cache = FileCache('things')
+    assert cache.get('key') is None
+    cache.set('key', {'a': [1, 2]})
+    assert cache.get('key') == {'a': [1, 2]}
+
+
+def test_evict_least_recently_used():
+    cache = FileCache('things', max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    past = time.time() - 100
+    os.utime(cache._file('a'), (past, past))
+    os.utime(cache._file('b'), (past + 1, past + 1))
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+
+
+class Clock(object):
+    now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_state_cache_ttl():
+    clock = Clock()
+    cache = StateCache(ttls={'stack': 10}, clock=clock)
+    created = datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    cache.set('stack', 'name', {'CreationTime': created})
+
+    assert cache.get('stack', 'name') == {'CreationTime': created}
+    assert cache.get('stack', 'other') is None
+    assert StateCache(fresh=True).get('stack', 'name') is None
+    clock.now += 11
+    assert cache.get('stack', 'name') is None
+
+
+def test_state_cache_invalidate():
+    cache = StateCache()
+    cache.set('stack', 'a', 1)
+    cache.set('stack', 'b', 2)
+    cache.set('service', 'a', 3)
+
+    cache.invalidate('stack', 'a')
+    assert cache.get('stack', 'a') is None
+    assert cache.get('stack', 'b') == 2
+    cache.invalidate('stack')
+    assert cache.get('stack', 'b') is None
+    assert cache.get('service', 'a') == 3
+
+
+def test_state_cache_opt_in(monkeypatch):
+    assert get_state_cache() is None
+    monkeypatch.setenv('BUDDY_STATE_CACHE', '1')
+    assert get_state_cache(fresh=True).fresh
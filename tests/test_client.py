@@ -0,0 +1,233 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+
+import buddy.client
+from buddy.client import (
+    CfnClient, EcsClient, chunked, get_client, get_session)
+from buddy.cache import StateCache
+from botocore.stub import Stubber
+from conftest import TEST_TEMPLATE, TEST_TEMPLATE_BODY
+import boto3
+import pytest
+
+
+def test_chunked():
+    assert chunked(range(5), 2) == [[0, 1], [2, 3], [4]]
+    assert chunked([], 2) == []
+
+
+@pytest.fixture
+def ecs_services(mock_ecs):
+    boto = boto3.client('ecs')
+    boto.register_task_definition(
+        family='hello',
+        containerDefinitions=[{'name': 'app', 'image': 'hello', 'memory': 1}],
+    )
+    services = []
+    for cluster in ['blue', 'green']:
+        boto.create_cluster(clusterName=cluster)
+        for i in range(12):
+            name = 'service-%s' % i
+            boto.create_service(
+                cluster=cluster, serviceName=name,
+                taskDefinition='hello', desiredCount=0,
+            )
+            services.append((cluster, name))
+    return services
+
+
+class CallCounter(object):
+    def __init__(self, fn):
+        self.fn = fn
+        self.calls = []
+
+    def __call__(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.fn(**kwargs)
+
+
+def test_describe_services_batch(ecs_services):
+    client = EcsClient()
+    counter = CallCounter(client.boto.describe_services)
+    client.boto.describe_services = counter
+
+    result = client.describe_services_batch(
+        ecs_services + [('blue', 'missing')])
+
+    assert sorted(result) == sorted(ecs_services)
+    assert result[('green', 'service-3')]['serviceName'] == 'service-3'
+    assert len(counter.calls) == 4
+    assert all(len(c['services']) <= 10 for c in counter.calls)
+
+
+def test_describe_tasks_batch_empty(mock_ecs):
+    assert EcsClient().describe_tasks_batch([]) == {}
+
+
+def test_run_tasks_split(mock_ecs):
+    def run_task(**kwargs):
+        return {'tasks': [{'taskArn': 'task'}] * kwargs['count'],
+                'failures': []}
+
+    client = EcsClient()
+    counter = CallCounter(run_task)
+    client.boto.run_task = counter
+
+    tasks, failures = client.run_tasks('cluster', 'task:1', 25)
+
+    assert len(tasks) == 25
+    assert failures == []
+    assert sorted(c['count'] for c in counter.calls) == [5, 10, 10]
+    assert 'overrides' not in counter.calls[0]
+
+
+@pytest.fixture
+def template_bucket(mock_s3):
+    boto3.client('s3').create_bucket(Bucket='templates')
+    return 'templates'
+
+
+def large_template(size):
+    template = dict(TEST_TEMPLATE, Description='x' * size)
+    return json.dumps(template)
+
+
+def test_small_template_inline(template_bucket):
+    client = CfnClient(template_bucket=template_bucket)
+    body = large_template(10)
+    assert client._template_args(body) == {'TemplateBody': body}
+
+
+def test_large_template_uploaded_once(mock_cloudformation, template_bucket):
+    client = CfnClient(template_bucket=template_bucket)
+    s3 = boto3.client('s3')
+    body = large_template(CfnClient.TEMPLATE_BODY_LIMIT)
+
+    client.create_stack('Big', body, {}, [])
+    keys = [o['Key'] for o in
+            s3.list_objects_v2(Bucket='templates')['Contents']]
+    assert len(keys) == 1
+    assert keys[0].startswith('buddy/')
+
+    other = CfnClient(template_bucket=template_bucket)
+    other.client = lambda name: NoPutS3(s3)
+    url = other.upload_template(body)
+    assert url.endswith(keys[0])
+    assert client.describe_stack('Big')['StackStatus'] == 'CREATE_COMPLETE'
+
+
+def test_templates_upload_concurrently(template_bucket):
+    s3 = boto3.client('s3')
+    # Both uploads must check S3 at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    class SlowS3(object):
+        meta = s3.meta
+
+        def head_object(self, **kwargs):
+            barrier.wait()
+            return s3.head_object(**kwargs)
+
+        def put_object(self, **kwargs):
+            return s3.put_object(**kwargs)
+
+    client = CfnClient(template_bucket=template_bucket)
+    client.client = lambda name: SlowS3()
+    bodies = [large_template(10), large_template(20)]
+    with ThreadPoolExecutor(2) as executor:
+        urls = list(executor.map(client.upload_template, bodies))
+    assert len(set(urls)) == 2
+
+
+class NoPutS3(object):
+    def __init__(self, s3):
+        self.s3 = s3
+        self.meta = s3.meta
+
+    def head_object(self, **kwargs):
+        return self.s3.head_object(**kwargs)
+
+    def put_object(self, **kwargs):
+        raise AssertionError('template already uploaded')
+
+
+def test_clients_are_rate_limited(mock_ecs):
+    client = EcsClient()
+    client.boto.list_clusters()
+    assert client.throttle.counters['calls'] == 1
+    assert ('ecs', 'ListClusters') in client.throttle.buckets
+
+
+def test_list_task_arns_pages():
+    client = EcsClient()
+    client._boto = boto3.client('ecs')
+    with Stubber(client.boto) as stubber:
+        args = {'cluster': 'cluster', 'serviceName': 'service',
+                'desiredStatus': 'STOPPED'}
+        stubber.add_response('list_tasks', {'taskArns': ['t1', 't2'],
+                                            'nextToken': 'next'}, args)
+        stubber.add_response('list_tasks', {'taskArns': ['t3']},
+                             dict(args, nextToken='next'))
+        arns = client.list_task_arns('cluster', 'service',
+                                     desired_status='STOPPED')
+        assert list(arns) == ['t1', 't2', 't3']
+
+
+def test_state_cache(mock_cloudformation, monkeypatch):
+    monkeypatch.setenv('BUDDY_STATE_CACHE', '1')
+    client = CfnClient(state_cache=StateCache())
+    counter = CallCounter(client.boto.describe_stacks)
+    client.boto.describe_stacks = counter
+    CfnClient().create_stack('stack', TEST_TEMPLATE_BODY, {}, [])
+
+    client.describe_stack('stack')
+    assert client.describe_stack('stack')['StackName'] == 'stack'
+    assert len(counter.calls) == 1
+    assert [s['StackName'] for s in client.list_stacks(['CREATE_COMPLETE'])
+            ] == ['stack']
+
+    # Changes made by any client invalidate the cache
+    CfnClient().delete_stack('stack', None)
+    with pytest.raises(Exception):
+        client.describe_stack('stack')
+    assert len(counter.calls) == 2
+    assert list(client.list_stacks(['CREATE_COMPLETE'])) == []
+
+
+def test_invalidation_reuses_the_cache(mock_cloudformation, monkeypatch):
+    monkeypatch.setenv('BUDDY_STATE_CACHE', '1')
+    opened = []
+    monkeypatch.setattr(buddy.client, 'get_state_cache',
+                        lambda: opened.append(StateCache()) or opened[-1])
+    client = CfnClient()
+    client.create_stack('stack', TEST_TEMPLATE_BODY, {}, [])
+    client.delete_stack('stack', None)
+    assert len(opened) == 1
+
+    # No second connection to the database the client already uses
+    opened[:] = []
+    cached = CfnClient(state_cache=StateCache())
+    cached.create_stack('other', TEST_TEMPLATE_BODY, {}, [])
+    assert opened[0]._db is None
+
+
+def test_state_cache_per_region(mock_cloudformation, tmpdir):
+    cache = StateCache(path=str(tmpdir.join('state.sqlite')))
+    CfnClient().create_stack('stack', TEST_TEMPLATE_BODY, {}, [])
+    east = CfnClient(state_cache=cache)
+    west = CfnClient(state_cache=cache, region_name='us-west-2')
+
+    assert [s['StackName'] for s in east.list_stacks(['CREATE_COMPLETE'])
+            ] == ['stack']
+    assert list(west.list_stacks(['CREATE_COMPLETE'])) == []
+    assert [s['StackName'] for s in east.list_stacks(['CREATE_COMPLETE'])
+            ] == ['stack']
+
+
+def test_clients_are_shared():
+    assert get_session() is get_session()
+    assert get_session() is not get_session(region_name='eu-west-1')
+    assert CfnClient().boto is CfnClient().boto
+    assert EcsClient().boto is get_client('ecs')
+    assert EcsClient().boto.meta.config.max_pool_connections > 10
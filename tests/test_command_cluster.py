@@ -1,4 +1,10 @@
+from buddy.client import EcsClient
 from buddy.command.cluster import cli
+from buddy.command.cluster.deployment import DEPLOYED, FAILED
+from buddy.command.cluster.service import Target
+from buddy.command.cluster.status import FleetStatus
+import boto3
+import json
 import pytest
 import yaml
 
@@ -78,3 +84,224 @@ def test_missing_port(runner, data):
     assert 'Unknown environment variable' in result.output
     assert 'MISSINGVAR' in result.output
     assert result.exit_code == 1
+
+
+@pytest.fixture
+def multi_data(data):
+    production = data['targets']['production']
+    data['targets']['prod-a'] = dict(production, service='SERVICE-A')
+    data['targets']['prod-b'] = dict(production, service='SERVICE-B')
+    data['targets']['staging'] = dict(production, service='SERVICE-S')
+    return data
+
+
+def test_dry_run_multiple_targets(runner, multi_data):
+    config = write_config(multi_data)
+
+    args = ['deploy', '--dry-run', config, 'prod-*', 'staging',
+            'image:tag', 'rev']
+    result = runner.invoke(cli, args)
+
+    assert not result.exception
+    assert '[prod-a] Definition:' in result.output
+    assert '[prod-b] Definition:' in result.output
+    assert '[staging] Definition:' in result.output
+    assert '[production]' not in result.output
+
+
+def test_dry_run_all_targets(runner, multi_data):
+    config = write_config(multi_data)
+
+    args = ['deploy', '--dry-run', '--all', config, 'image:tag', 'rev']
+    result = runner.invoke(cli, args)
+
+    assert not result.exception
+    for name in ['production', 'prod-a', 'prod-b', 'staging']:
+        assert '[%s] Definition:' % name in result.output
+
+
+def test_unknown_target(runner, multi_data):
+    config = write_config(multi_data)
+
+    args = ['deploy', '--dry-run', config, 'nope-*', 'image:tag', 'rev']
+    result = runner.invoke(cli, args)
+
+    assert 'Unknown target: nope-*' in result.output
+    assert result.exit_code == 1
+
+
+def test_parallel_deploy_aggregates_failures(runner, multi_data, monkeypatch):
+    import buddy.command.cluster as cluster
+
+    def fake_deploy_service(app, containers, ecs=None, echo=None,
+                            force=False):
+        echo.step('deploying %s' % app.service_name)
+        if app.target_name == 'prod-b':
+            cluster.failure('boom')
+
+    monkeypatch.setattr(cluster, 'EcsClient', lambda: None)
+    monkeypatch.setattr(cluster, 'deploy_service', fake_deploy_service)
+    config = write_config(multi_data)
+
+    args = ['deploy', config, 'prod-a', 'prod-b', 'image:tag', 'rev']
+    result = runner.invoke(cli, args)
+
+    assert '[prod-a] deploying SERVICE-A' in result.output
+    assert 'prod-a: success' in result.output
+    assert 'prod-b: failed (boom)' in result.output
+    assert '1/2 deployments failed' in result.output
+    assert result.exit_code == 1
+
+
+def test_deploy_failure_rolls_back(data, monkeypatch):
+    import click
+    import buddy.command.cluster as cluster
+
+    class FakeRegistry(object):
+        def __init__(self, ecs):
+            pass
+
+        def matches(self, arn, family, digest):
+            return False
+
+        def register(self, family, containers, reuse=True):
+            return 'td:2', True
+
+    class FakeHealth(object):
+        def __init__(self, *args):
+            pass
+
+        def start(self):
+            pass
+
+    class FakeEcs(object):
+        def __init__(self):
+            self.updates = []
+
+        def update_service(self, cluster_name, service_name, arn):
+            self.updates.append(arn)
+
+    def wait_for_deploy(self, timeout, task_definition_arn=None,
+                        health=None):
+        waits.append((timeout, task_definition_arn))
+        if health is not None:
+            self.diagnosis = '3 tasks failed, 3 times: OutOfMemory'
+            return FAILED
+        return DEPLOYED
+
+    waits = []
+    monkeypatch.setattr(cluster, 'TaskDefinitionRegistry', FakeRegistry)
+    monkeypatch.setattr(cluster, 'HealthMonitor', FakeHealth)
+    monkeypatch.setattr(cluster.EcsServiceAction, 'wait_for_deploy',
+                        wait_for_deploy)
+    monkeypatch.setattr(cluster.EcsServiceAction,
+                        'get_active_task_definition_arn', lambda s: 'td:1')
+    data['targets']['production'].update(timeout=60, rollback=True)
+    ecs = FakeEcs()
+
+    with pytest.raises(click.ClickException) as info:
+        cluster.deploy_service(Target(data, 'production'), [], ecs=ecs)
+
+    assert str(info.value.message) == (
+        'Deployment failed (3 tasks failed, 3 times: OutOfMemory), '
+        'rolled back to td:1')
+    assert ecs.updates == ['td:2', 'td:1']
+    assert waits == [(60, 'td:2'), (60, 'td:1')]
+
+
+@pytest.fixture
+def ecs_service(mock_ecs):
+    boto = boto3.client('ecs')
+    boto.create_cluster(clusterName='CLUSTERNAME')
+    boto.register_task_definition(
+        family='TASKNAME',
+        containerDefinitions=[{'name': 'app', 'image': 'hello', 'memory': 1}],
+    )
+    boto.create_service(
+        cluster='CLUSTERNAME', serviceName='SERVICENAME',
+        taskDefinition='TASKNAME', desiredCount=1,
+    )
+
+
+def test_status(runner, data, ecs_service):
+    data['targets']['missing'] = dict(
+        data['targets']['production'], service='NOPE')
+    config = write_config(data)
+
+    result = runner.invoke(cli, ['status', config])
+
+    assert not result.exception
+    lines = result.output.splitlines()
+    production = [line for line in lines if line.startswith('production')]
+    assert 'SERVICENAME' in production[0]
+    assert 'TASKNAME:1' in production[0]
+    missing = [line for line in lines if line.startswith('missing')]
+    assert 'MISSING' in missing[0]
+
+
+def test_status_profile_and_trace(runner, data, ecs_service):
+    config = write_config(data)
+
+    result = runner.invoke(cli, ['--profile', '--trace', 'trace.jsonl',
+                                 'status', config])
+
+    assert not result.exception
+    assert 'ecs.DescribeServices' in result.output
+    assert 'Throttled: 0' in result.output
+    with open('trace.jsonl') as fp:
+        names = [json.loads(line)['name'] for line in fp]
+    assert 'ecs.DescribeServices' in names
+
+
+def test_status_csv(runner, data, ecs_service):
+    config = write_config(data)
+
+    result = runner.invoke(cli, ['status', '--output', 'csv', config])
+
+    assert not result.exception
+    lines = result.output.splitlines()
+    assert lines[0].startswith('Target,Cluster,Service')
+    assert lines[1].startswith('production,CLUSTERNAME,SERVICENAME,1,')
+
+
+def test_status_refreshes_only_changes(data, ecs_service):
+    ecs = EcsClient()
+    fleet = FleetStatus(ecs, [Target(data, 'production')])
+    calls = []
+    list_tasks = ecs.list_tasks
+    ecs.list_tasks = lambda *args: calls.append(args) or list_tasks(*args)
+
+    first = fleet.refresh()
+    second = fleet.refresh()
+
+    assert first == second
+    assert calls == [('CLUSTERNAME', 'SERVICENAME')]
+
+
+def test_gc(runner, data, mock_ecs):
+    boto = boto3.client('ecs')
+    containers = [{'name': 'app', 'image': 'hello', 'memory': 1}]
+    for family in ['TASKNAME'] * 6 + ['TASKNAME-other']:
+        boto.register_task_definition(
+            family=family, containerDefinitions=containers)
+    boto.create_cluster(clusterName='CLUSTERNAME')
+    boto.create_service(cluster='CLUSTERNAME', serviceName='SERVICENAME',
+                        taskDefinition='TASKNAME:2', desiredCount=0)
+    config = write_config(data)
+
+    result = runner.invoke(cli, ['gc', '--keep', '2', '--dry-run', config])
+    assert not result.exception
+    assert 'Would deregister' in result.output
+    assert 'TASKNAME:1\n' in result.output
+    assert 'TASKNAME:2\n' not in result.output
+
+    result = runner.invoke(cli, ['gc', '--keep', '2', config])
+    assert not result.exception
+    active = boto.list_task_definitions(status='ACTIVE')['taskDefinitionArns']
+    assert sorted(arn.rsplit('/', 1)[1] for arn in active) == [
+        'TASKNAME-other:1', 'TASKNAME:2', 'TASKNAME:5', 'TASKNAME:6']
+    assert 'Deregistered' in result.output
+
+    result = runner.invoke(cli, ['gc', '--family', 'TASKNAME-other', config])
+    assert result.exit_code == 1
+    assert 'Not a task of config.yaml: TASKNAME-other' in result.output
@@ -0,0 +1,107 @@
+import datetime
+
+from buddy.command.cluster.config import (
+    ClusterConfig, ConfigError, load_config)
+import pytest
+import yaml
+
+
+@pytest.fixture
+def data():
+    return {
+        'targets': {
+            'production': {
+                'cluster': 'CLUSTER',
+                'service': 'SERVICE',
+                'task': 'TASK',
+                'environment': 'ENV',
+            },
+        },
+        'tasks': {'TASK': {'containers': ['app']}},
+        'environments': {'ENV': {'VAR': 'value'}},
+        'containers': {
+            'app': {'properties': {'cpu': 1}, 'environment': ['VAR']},
+        },
+    }
+
+
+def test_compile(data):
+    config = ClusterConfig.compile(data)
+    target = config.targets['production']
+    assert target.cluster == 'CLUSTER'
+    assert target.task is config.tasks['TASK']
+    assert target.task.containers[0] is config.containers['app']
+    assert target.environment == {'VAR': 'value'}
+    assert target.timeout == 300
+    assert target.rollback is False
+
+
+def test_timeout_and_rollback(data):
+    data['targets']['production'].update(timeout=120, rollback=True)
+    target = ClusterConfig.compile(data).targets['production']
+    assert (target.timeout, target.rollback) == (120, True)
+
+    data['targets']['production']['timeout'] = '2m'
+    assert_error(data, 'cluster.yaml: targets.production.timeout: '
+                       'must be a number of seconds')
+    data['targets']['production'].update(timeout=60, rollback='yes')
+    assert_error(data, 'cluster.yaml: targets.production.rollback: '
+                       'must be true or false')
+
+
+def assert_error(data, message):
+    with pytest.raises(ConfigError) as info:
+        ClusterConfig.compile(data, source='cluster.yaml')
+    assert str(info.value) == message
+
+
+def test_unknown_task(data):
+    data['targets']['production']['task'] = 'NOPE'
+    assert_error(data, "cluster.yaml: targets.production.task: "
+                       "unknown task 'NOPE'")
+
+
+def test_unknown_container(data):
+    data['tasks']['TASK']['containers'].append('nope')
+    assert_error(data, "cluster.yaml: tasks.TASK.containers: "
+                       "unknown container 'nope'")
+
+
+def test_missing_environment(data):
+    del data['environments']
+    assert_error(data, 'cluster.yaml: targets.production.environment: '
+                       'Missing environment ENV')
+
+
+def test_unknown_variable(data):
+    data['containers']['app']['environment'].append('OTHER')
+    assert_error(data, "cluster.yaml: targets.production: Unknown "
+                       "environment variable 'OTHER' (container app)")
+
+
+def test_missing_and_unknown_keys(data):
+    del data['targets']['production']['service']
+    assert_error(data, "cluster.yaml: targets.production: missing 'service'")
+    data['targets']['production']['service'] = 'SERVICE'
+    data['targets']['production']['servce'] = 'typo'
+    assert_error(data, 'cluster.yaml: targets.production.servce: '
+                       'unknown key')
+
+
+def test_load_config_keeps_yaml_types(data, tmpdir):
+    properties = {'cpu': 1, 'labels': {'released': datetime.date(2020, 1, 2),
+                                       8080: 'http'}}
+    data['containers']['app']['properties'] = properties
+    path = tmpdir.join('cluster.yaml')
+    path.write(yaml.safe_dump(data))
+    for _ in range(2):
+        config = load_config(str(path))
+        assert config.containers['app'].properties == properties
+
+
+def test_load_config_invalid_yaml(tmpdir):
+    path = tmpdir.join('cluster.yaml')
+    path.write('targets: [')
+    with pytest.raises(ConfigError) as info:
+        load_config(str(path))
+    assert 'invalid YAML' in str(info.value)
@@ -0,0 +1,131 @@
+from buddy.command.cluster.deployment import (
+    DeploymentMonitor, DEPLOYED, FAILED, HealthMonitor, task_failure)
+
+
+def deployment(status, task_definition, running, desired=2, **extra):
+    dep = {
+        'status': status,
+        'taskDefinition': task_definition,
+        'runningCount': running,
+        'desiredCount': desired,
+    }
+    dep.update(extra)
+    return dep
+
+
+def state(deployments, events=()):
+    return {'deployments': deployments, 'events': list(events)}
+
+
+def event(id, message):
+    return {'id': id, 'message': message}
+
+
+def test_in_progress():
+    monitor = DeploymentMonitor('td:2')
+    s = state([deployment('PRIMARY', 'td:2', 1),
+               deployment('ACTIVE', 'td:1', 2)])
+    assert monitor.status(s, []) is None
+
+
+def test_converged_while_old_deployment_drains():
+    monitor = DeploymentMonitor('td:2')
+    s = state([deployment('PRIMARY', 'td:2', 2),
+               deployment('ACTIVE', 'td:1', 0)])
+    assert monitor.status(s, []) == DEPLOYED
+
+
+def test_other_primary_is_not_deployed():
+    monitor = DeploymentMonitor('td:3')
+    s = state([deployment('PRIMARY', 'td:2', 2)])
+    assert monitor.status(s, []) is None
+
+
+def test_rollout_failed():
+    monitor = DeploymentMonitor('td:2')
+    s = state([deployment('PRIMARY', 'td:2', 0, rolloutState='FAILED')])
+    assert monitor.status(s, []) == FAILED
+
+
+def test_only_new_events_are_reported():
+    monitor = DeploymentMonitor('td:2')
+    old = event('1', 'service x has reached a steady state.')
+    first = state([deployment('PRIMARY', 'td:2', 1)], [old])
+    assert monitor.new_events(first) == []
+
+    new = [event('3', 'service x has reached a steady state.'),
+           event('2', 'service x has started 1 tasks')]
+    second = state([deployment('PRIMARY', 'td:2', 1)], new + [old])
+    events = monitor.new_events(second)
+    assert [e['id'] for e in events] == ['2', '3']
+    assert monitor.status(second, events) == DEPLOYED
+
+
+def stopped_task(arn, task_definition='td:2', exit_code=1, **extra):
+    task = {
+        'taskArn': arn,
+        'taskDefinitionArn': task_definition,
+        'lastStatus': 'STOPPED',
+        'stopCode': 'EssentialContainerExited',
+        'stoppedReason': 'Essential container in task exited',
+        'containers': [{'name': 'app', 'exitCode': exit_code}],
+    }
+    task.update(extra)
+    return task
+
+
+class FakeEcs(object):
+    def __init__(self, tasks=()):
+        self.tasks = {t['taskArn']: t for t in tasks}
+
+    def list_task_arns(self, cluster, service, desired_status=None):
+        assert desired_status == 'STOPPED'
+        return iter(list(self.tasks))
+
+    def describe_tasks_batch(self, pairs):
+        return {arn: self.tasks[arn] for _, arn in pairs}
+
+
+def test_task_failure():
+    assert task_failure(stopped_task('t1')) == (
+        'Essential container in task exited; app exited with 1')
+    assert task_failure({
+        'stopCode': 'TaskFailedToStart',
+        'stoppedReason': 'CannotPullContainerError: not found',
+        'containers': [{'name': 'app', 'reason': 'pull failed'}],
+    }) == 'CannotPullContainerError: not found; app: pull failed'
+    assert task_failure({
+        'stopCode': 'ServiceSchedulerInitiated',
+        'stoppedReason': 'Task failed ELB health checks in (target-group)',
+    }) == 'Task failed ELB health checks in (target-group)'
+    # Scaled in or replaced by a deployment
+    assert task_failure(stopped_task(
+        't1', exit_code=0, stopCode='ServiceSchedulerInitiated',
+        stoppedReason='Scaling activity initiated by deployment')) is None
+
+
+def test_health_monitor_counts_new_failures():
+    ecs = FakeEcs([stopped_task('old', task_definition='td:2')])
+    health = HealthMonitor(ecs, 'cluster', 'service', 'td:2',
+                           max_failures=2)
+    health.start()
+    assert health.check([]) is None
+
+    ecs.tasks['t1'] = stopped_task('t1')
+    ecs.tasks['t2'] = stopped_task('t2', task_definition='td:1')
+    assert health.check([]) is None
+
+    ecs.tasks['t3'] = stopped_task('t3')
+    assert health.check([]) == (
+        '2 tasks failed, 2 times: '
+        'Essential container in task exited; app exited with 1')
+
+
+def test_health_monitor_events():
+    health = HealthMonitor(FakeEcs(), 'cluster', 'service', 'td:2')
+    placement = ('(service web) was unable to place a task because no '
+                 'container instance met all of its requirements.')
+    assert health.check([event('1', placement)]) is None
+    message = ('(service web) is unable to consistently start tasks '
+               'successfully.')
+    assert health.check([event('2', message)]) == message
@@ -0,0 +1,58 @@
+from buddy.command.cluster.run import TaskRun
+
+
+class FakeEcs(object):
+    def __init__(self, exit_codes):
+        self.exit_codes = exit_codes
+        self.calls = []
+        self.polls = 0
+
+    def run_tasks(self, cluster, task_definition, count, started_by,
+                  overrides):
+        self.calls.append(overrides)
+        start = len(self.calls) * 100
+        return [{'taskArn': 'arn/%s' % (start + i)}
+                for i in range(count)], []
+
+    def describe_tasks_batch(self, pairs):
+        self.polls += 1
+        tasks = {}
+        for n, (_, arn) in enumerate(sorted(pairs)):
+            stopped = n < self.polls
+            tasks[arn] = {
+                'taskArn': arn,
+                'lastStatus': 'STOPPED' if stopped else 'RUNNING',
+                'containers': [{'name': 'app',
+                                'exitCode': self.exit_codes.get(arn, 0)}],
+            }
+        return tasks
+
+
+def test_run_and_track():
+    ecs = FakeEcs({'arn/101': 2})
+    run = TaskRun(ecs, 'cluster', 'task:1', 'app', ['migrate'], count=3)
+
+    assert run.start() == []
+    assert run.running == ['arn/100', 'arn/101', 'arn/102']
+    assert ecs.calls == [{'containerOverrides': [
+        {'name': 'app', 'command': ['migrate']}]}]
+
+    assert not run.poll()
+    assert run.wait(timeout=0)
+    assert run.exit_codes == {'arn/100': 0, 'arn/101': 2, 'arn/102': 0}
+    assert run.failed == ['arn/101']
+
+
+def test_sharded():
+    ecs = FakeEcs({})
+    run = TaskRun(ecs, 'cluster', 'task:1', 'app', ['job'], count=3,
+                  sharded=True)
+
+    run.start()
+
+    assert len(run.running) == 3
+    environments = sorted(
+        tuple(v['value'] for v in o['containerOverrides'][0]['environment'])
+        for o in ecs.calls
+    )
+    assert environments == [('0', '3'), ('1', '3'), ('2', '3')]
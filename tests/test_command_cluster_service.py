@@ -0,0 +1,74 @@
+from buddy.command.cluster import service
+from buddy.command.cluster.config import ContainerConfig
+from buddy.command.cluster.templating import compile_template
+
+
+CONTEXT = {'task_name': 'TASK', 'aws_region': 'eu-west-1', 'build_rev': 'R1'}
+
+
+def test_compile_template():
+    render = compile_template({
+        'command': ['run', '--rev={build_rev}', '{unknown}'],
+        'port': 80,
+    })
+    assert render(CONTEXT) == {
+        'command': ['run', '--rev=R1', '{unknown}'],
+        'port': 80,
+    }
+    first = render(CONTEXT)
+    first['command'].append('x')
+    assert render(CONTEXT)['command'] == ['run', '--rev=R1', '{unknown}']
+
+
+def test_container_definition_does_not_modify_config():
+    properties = {
+        'logConfiguration': {
+            'logDriver': 'awslogs',
+            'options': {'awslogs-group': 'group-{aws_region}'},
+        },
+    }
+    container = ContainerConfig('app', properties, ['VAR'])
+
+    definition = service.make_container_definition(
+        container, 'image:R1', {'VAR': 'value'}, CONTEXT)
+
+    assert definition['image'] == 'image:R1'
+    assert definition['environment'] == [{'name': 'VAR', 'value': 'value'}]
+    assert definition['logConfiguration']['options'] == {
+        'awslogs-group': 'group-eu-west-1',
+        'awslogs-region': 'eu-west-1',
+        'awslogs-stream-prefix': 'R1',
+    }
+    assert properties == {
+        'logConfiguration': {
+            'logDriver': 'awslogs',
+            'options': {'awslogs-group': 'group-{aws_region}'},
+        },
+    }
+
+
+def test_plugin_configurators(monkeypatch):
+    class EntryPoint(object):
+        def __init__(self, name, fn):
+            self.name = name
+            self.fn = fn
+
+        def load(self):
+            return self.fn
+
+    def tag(context, properties):
+        return dict(properties, dockerLabels={'rev': context['build_rev']})
+
+    monkeypatch.setattr(service, '_configurators', None)
+    monkeypatch.setattr(service, '_entry_points', lambda group: [
+        EntryPoint('cloudwatch_logs', None),
+        EntryPoint('tag', tag),
+    ])
+
+    configurators = service.get_configurators()
+    assert configurators == [service.cloudwatch_log_configurator, tag]
+
+    definition = service.make_container_definition(
+        ContainerConfig('app', {}, []), 'image', {}, CONTEXT)
+    assert definition['dockerLabels'] == {'rev': 'R1'}
+    monkeypatch.setattr(service, '_configurators', None)
@@ -0,0 +1,105 @@
+from buddy.client import EcsClient
+from buddy.command.cluster import deploy_service
+from buddy.command.cluster.service import Target
+from buddy.command.cluster.taskdef import (
+    definition_hash, TaskDefinitionRegistry)
+import boto3
+import pytest
+
+
+CONTAINERS = [{'name': 'app', 'image': 'hello:1', 'memory': 10}]
+
+
+def test_definition_hash_is_canonical():
+    reordered = [{'memory': 10, 'image': 'hello:1', 'name': 'app'}]
+    assert definition_hash(CONTAINERS) == definition_hash(reordered)
+    changed = [dict(CONTAINERS[0], image='hello:2')]
+    assert definition_hash(CONTAINERS) != definition_hash(changed)
+
+
+def test_register_reuses_identical_revision(mock_ecs):
+    registry = TaskDefinitionRegistry(EcsClient())
+
+    arn, registered = registry.register('hello', CONTAINERS)
+    assert registered
+    assert registry.register('hello', CONTAINERS) == (arn, False)
+
+    other, registered = registry.register('hello', CONTAINERS, reuse=False)
+    assert registered
+    assert other != arn
+
+
+def test_match_checks_family(mock_ecs):
+    registry = TaskDefinitionRegistry(EcsClient())
+    arn, _ = registry.register('hello', CONTAINERS)
+    digest = definition_hash(CONTAINERS)
+    assert registry.matches(arn, 'hello', digest)
+    assert not registry.matches(arn, 'renamed', digest)
+
+    other, registered = registry.register('renamed', CONTAINERS)
+    assert registered
+    assert ':task-definition/renamed:' in other
+
+
+def test_register_ignores_deregistered_revision(mock_ecs):
+    ecs = EcsClient()
+    registry = TaskDefinitionRegistry(ecs)
+    arn, _ = registry.register('hello', CONTAINERS)
+    ecs.deregister_task_definition(arn)
+
+    new_arn, registered = registry.register('hello', CONTAINERS)
+    assert registered
+    assert new_arn != arn
+
+
+def test_register_without_tag_permission(mock_ecs, monkeypatch):
+    import botocore.exceptions
+    ecs = EcsClient()
+    register = ecs.register_task_definition
+
+    def deny_tags(family, containers, volumes=None, tags=None):
+        if tags:
+            raise botocore.exceptions.ClientError(
+                {'Error': {'Code': 'AccessDeniedException',
+                           'Message': 'not authorized: ecs:TagResource'}},
+                'RegisterTaskDefinition')
+        return register(family, containers, volumes)
+
+    monkeypatch.setattr(ecs, 'register_task_definition', deny_tags)
+    registry = TaskDefinitionRegistry(ecs)
+    arn, registered = registry.register('hello', CONTAINERS)
+    assert registered
+    other, registered = registry.register('hello', CONTAINERS)
+    assert registered
+    assert other != arn
+
+
+@pytest.fixture
+def target(mock_ecs):
+    registry = TaskDefinitionRegistry(EcsClient())
+    arn, _ = registry.register('hello', CONTAINERS)
+    boto = boto3.client('ecs')
+    boto.create_cluster(clusterName='cluster')
+    boto.create_service(cluster='cluster', serviceName='service',
+                        taskDefinition=arn, desiredCount=0)
+    data = {
+        'targets': {'prod': {'cluster': 'cluster', 'service': 'service',
+                             'task': 'hello'}},
+        'tasks': {'hello': {'containers': ['app']}},
+        'containers': {'app': {'properties': {}}},
+    }
+    return Target(data, 'prod')
+
+
+def test_deploy_unchanged_definition(target, monkeypatch, capsys):
+    ecs = EcsClient()
+
+    def fail(*args, **kwargs):
+        raise AssertionError('nothing should be registered')
+
+    monkeypatch.setattr(ecs, 'register_task_definition', fail)
+    monkeypatch.setattr(ecs, 'update_service', fail)
+
+    deploy_service(target, CONTAINERS, ecs=ecs)
+
+    assert 'Unchanged' in capsys.readouterr().out
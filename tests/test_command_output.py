@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta, timezone
+import json
+
+from buddy.command.output import echo_mapping, echo_rows
+from buddy.command.utils import human_date
+
+
+COLUMNS = ['Name', 'Time']
+WHEN = datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+
+def collect(rows, output):
+    lines = []
+    echo_rows(rows, COLUMNS, output=output,
+              echo=lambda s='', nl=True: lines.append(s))
+    return lines
+
+
+def test_jsonl_streams_rows():
+    consumed = []
+
+    def rows():
+        for name in ['a', 'b']:
+            consumed.append(name)
+            yield [name, WHEN.isoformat()]
+
+    lines = []
+
+    def echo(s='', nl=True):
+        # Each row is printed before the next one is produced
+        assert len(consumed) == len(lines) + 1
+        lines.append(s)
+
+    echo_rows(rows(), COLUMNS, output='jsonl', echo=echo)
+    assert [json.loads(line)['Name'] for line in lines] == ['a', 'b']
+
+
+def test_json_and_csv():
+    rows = [['a', 1], ['b,c', 2]]
+    assert json.loads(''.join(collect(iter(rows), 'json'))) == [
+        {'Name': 'a', 'Time': 1}, {'Name': 'b,c', 'Time': 2}]
+    assert json.loads(''.join(collect(iter([]), 'json'))) == []
+    assert collect(iter(rows), 'csv') == ['Name,Time', 'a,1', '"b,c",2']
+
+
+def test_csv_encodes_structures():
+    lines = []
+    tags = [{'Key': 'team', 'Value': 'infra'}]
+    echo_rows(iter([['a', tags]]), ['Name', 'Tags'], output='csv',
+              echo=lines.append)
+    assert lines == [
+        'Name,Tags', 'a,"[{""Key"": ""team"", ""Value"": ""infra""}]"']
+
+
+def test_echo_mapping_json():
+    lines = []
+    echo_mapping({'When': WHEN, 'ResponseMetadata': {}}, output='jsonl',
+                 echo=lines.append)
+    assert json.loads(lines[0]) == {'When': '2020-01-02T03:04:05+00:00'}
+
+
+def test_human_date():
+    assert human_date(None) == ''
+    hour_ago = datetime.now(timezone.utc) - timedelta(hours=1)
+    assert human_date(hour_ago) == 'an hour ago'
+    assert human_date(hour_ago) is human_date(hour_ago)
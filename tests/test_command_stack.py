@@ -1,4 +1,17 @@
-from buddy.command.stack import cli
+from datetime import datetime, timedelta, timezone
+import json
+import os
+
+from buddy.client import CfnClient
+from buddy.command.stack import (
+    cli, fingerprint, parse_age, StackEventTail, StackFilter,
+    StackOperationWatcher)
+from conftest import TEST_TEMPLATE, TEST_TEMPLATE_BODY
+import yaml
+
+
+UPDATED_TEMPLATE = dict(TEST_TEMPLATE, Description='Updated')
+UPDATED_TEMPLATE_BODY = json.dumps(UPDATED_TEMPLATE)
 
 
 def test_list_empty(mock_cloudformation, runner):
@@ -11,3 +24,283 @@ def test_list(mock_cloudformation, runner, stack):
     assert result.exit_code == 0
     assert 'HelloWorld' in result.output
     assert 'CREATE_COMPLETE' in result.output
+
+
+def test_list_jsonl(mock_cloudformation, runner, stack):
+    result = runner.invoke(cli, ['list', '--output', 'jsonl'])
+    assert result.exit_code == 0
+    stacks = [json.loads(line) for line in result.output.splitlines()]
+    assert stacks[0]['StackName'] == 'HelloWorld'
+    assert stacks[0]['CreationTime'].startswith('20')
+
+
+def test_stack_filter():
+    now = datetime(2020, 1, 10, tzinfo=timezone.utc)
+    stack = {
+        'StackName': 'prod-api',
+        'StackStatus': 'CREATE_COMPLETE',
+        'CreationTime': datetime(2020, 1, 1, tzinfo=timezone.utc),
+        'Tags': [{'Key': 'env', 'Value': 'prod'}],
+    }
+
+    def select(**kwargs):
+        return StackFilter(now=now, **kwargs)(stack)
+
+    assert select(prefix='prod-', pattern='api$')
+    assert not select(prefix='staging-')
+    assert not select(statuses=['UPDATE_COMPLETE'])
+    assert select(older_than=timedelta(days=7))
+    assert not select(newer_than=timedelta(days=7))
+    assert select(tags={'env': 'prod'}) and select(tags={'env': None})
+    assert not select(tags={'env': 'staging'})
+    assert select(nested=False)
+    stack['ParentId'] = 'arn:parent'
+    assert not select(nested=False)
+
+
+def test_parse_age():
+    assert parse_age('90m') == timedelta(minutes=90)
+    assert parse_age('7d') == timedelta(days=7)
+
+
+def test_list_filters(mock_cloudformation, runner):
+    client = CfnClient()
+    for name in ['prod-api', 'prod-web', 'staging-api']:
+        client.create_stack(name, TEST_TEMPLATE_BODY, {}, [])
+    client.boto.update_stack(
+        StackName='prod-web', TemplateBody=TEST_TEMPLATE_BODY,
+        Tags=[{'Key': 'team', 'Value': 'web'}])
+
+    def names(*args):
+        result = runner.invoke(cli, ['list', '-o', 'jsonl'] + list(args))
+        assert result.exit_code == 0, result.output
+        return sorted(json.loads(line)['StackName']
+                      for line in result.output.splitlines())
+
+    assert names('--prefix', 'prod-') == ['prod-api', 'prod-web']
+    assert names('--match', '-api$') == ['prod-api', 'staging-api']
+    assert len(names('--limit', '2')) == 2
+    assert names('--tag', 'team=web') == ['prod-web']
+    assert names('--describe', '--older-than', '1d') == []
+
+    result = runner.invoke(cli, ['list', '--older-than', 'soon'])
+    assert result.exit_code == 2
+
+
+def test_events_limit(mock_cloudformation, runner, stack):
+    result = runner.invoke(cli, ['events', '--limit', '1', 'HelloWorld'])
+    assert result.exit_code == 0
+    assert 'CREATE_COMPLETE' in result.output
+    assert 'CREATE_IN_PROGRESS' not in result.output
+
+
+def test_events_follow_finished_stack(mock_cloudformation, runner, stack):
+    result = runner.invoke(cli, ['events', '--follow', 'HelloWorld'])
+    assert result.exit_code == 0
+    assert 'HelloWorld' in result.output
+    assert 'CREATE_COMPLETE' in result.output
+
+
+def test_event_tail_fetches_new_events_only(mock_cloudformation, stack):
+    client = CfnClient()
+    tail = StackEventTail(client, 'HelloWorld')
+    backlog = tail.start(backlog=100)
+    assert backlog
+    assert tail.is_final(backlog[-1])
+    assert tail.poll() == []
+
+    client.boto.update_stack(
+        StackName='HelloWorld', TemplateBody=UPDATED_TEMPLATE_BODY)
+    new = tail.poll()
+    assert new
+    assert not set(e['EventId'] for e in new) & set(
+        e['EventId'] for e in backlog)
+    assert tail.poll() == []
+
+
+def write_stack_file(name='production', template=TEST_TEMPLATE_BODY):
+    with open('template.json', 'w') as fh:
+        fh.write(template)
+    path = '%s.yaml' % name
+    with open(path, 'w') as fh:
+        fh.write('name: HelloWorld\ntemplate: template.json\n')
+    return path
+
+
+def test_create_wait(mock_cloudformation, runner):
+    result = runner.invoke(cli, ['create', '--wait', write_stack_file()])
+    assert result.exit_code == 0
+    assert 'CREATE_COMPLETE' in result.output
+    assert 'Duration (s)' in result.output
+
+
+def test_update_wait(mock_cloudformation, runner, stack):
+    path = write_stack_file(template=UPDATED_TEMPLATE_BODY)
+    result = runner.invoke(cli, ['update', '--wait', path])
+    assert result.exit_code == 0
+    assert 'UPDATE_COMPLETE' in result.output
+    assert 'CREATE_COMPLETE' not in result.output
+
+
+def stack_event(logical_id, status, second, resource_type='AWS::SNS::Topic'):
+    return {
+        'LogicalResourceId': logical_id,
+        'ResourceType': resource_type,
+        'ResourceStatus': status,
+        'Timestamp': datetime(2017, 1, 1, 0, 0, second),
+    }
+
+
+def test_operation_watcher_durations():
+    watcher = StackOperationWatcher(client=None, name='HelloWorld')
+    watcher.events = [
+        stack_event('Fast', 'UPDATE_IN_PROGRESS', 1),
+        stack_event('Slow', 'UPDATE_IN_PROGRESS', 1),
+        stack_event('Fast', 'UPDATE_COMPLETE', 3),
+        stack_event('Slow', 'UPDATE_COMPLETE', 40),
+    ]
+    assert watcher.durations() == [
+        ('Slow', 'AWS::SNS::Topic', 'UPDATE_COMPLETE', 39),
+        ('Fast', 'AWS::SNS::Topic', 'UPDATE_COMPLETE', 2),
+    ]
+
+
+def test_operation_watcher_rollback_fails():
+    watcher = StackOperationWatcher(client=None, name='HelloWorld')
+    watcher.final_event = stack_event(
+        'HelloWorld', 'UPDATE_ROLLBACK_COMPLETE', 0)
+    assert not watcher.succeeded
+    watcher.final_event = stack_event('HelloWorld', 'UPDATE_COMPLETE', 0)
+    assert watcher.succeeded
+
+
+def test_update_change_set_no_changes(mock_cloudformation, runner, stack):
+    result = runner.invoke(cli, ['update', '--change-set', write_stack_file()])
+    assert result.exit_code == 0
+    assert 'No changes: HelloWorld' in result.output
+
+
+def test_update_change_set_execute(mock_cloudformation, runner, stack):
+    path = write_stack_file(template=UPDATED_TEMPLATE_BODY)
+    result = runner.invoke(cli, ['update', '--change-set', '--yes', path])
+    assert result.exit_code == 0
+    assert 'No changes' not in result.output
+    assert 'LogicalResourceId' in result.output
+
+
+def test_fingerprint_ignores_json_formatting():
+    pretty = json.dumps(TEST_TEMPLATE, indent=4)
+    assert fingerprint(pretty, {'A': '1'}) == fingerprint(
+        TEST_TEMPLATE, {'A': '1'})
+    assert fingerprint(pretty, {'A': '1'}) != fingerprint(
+        TEST_TEMPLATE, {'A': '2'})
+
+
+def write_stack_files(*names, **depends_on):
+    os.mkdir('stacks')
+    with open('stacks/template.json', 'w') as fh:
+        fh.write(TEST_TEMPLATE_BODY)
+    for name in names:
+        with open('stacks/%s.yaml' % name, 'w') as fh:
+            fh.write(yaml.safe_dump({
+                'name': name,
+                'template': 'template.json',
+                'depends_on': depends_on.get(name, []),
+            }))
+    return 'stacks'
+
+
+def test_create_directory(mock_cloudformation, runner):
+    path = write_stack_files('vpc', 'db', 'app', app=['db'], db=['vpc'])
+    result = runner.invoke(cli, ['create', path])
+    assert result.exit_code == 0
+    assert '[vpc] StackId' in result.output
+    for name in ['vpc', 'db', 'app']:
+        assert CfnClient().describe_stack(name)['StackStatus'] == (
+            'CREATE_COMPLETE')
+
+
+def test_create_directory_skips_templates(mock_cloudformation, runner):
+    path = write_stack_files('vpc')
+    with open(os.path.join(path, 'template.yaml'), 'w') as fh:
+        fh.write('Resources:\n  Queue:\n    Type: AWS::SQS::Queue\n'
+                 'Outputs:\n  Url:\n    Value: !Ref Queue\n')
+    with open(os.path.join(path, 'cluster.yaml'), 'w') as fh:
+        fh.write('targets: {}\n')
+    result = runner.invoke(cli, ['create', path])
+    assert result.exit_code == 0, result.output
+    assert CfnClient().describe_stack('vpc')['StackStatus'] == (
+        'CREATE_COMPLETE')
+
+
+def test_show_glob_reports_failures(mock_cloudformation, runner, stack):
+    write_stack_files('HelloWorld', 'missing')
+    result = runner.invoke(cli, ['show', 'stacks/*.yaml'])
+    assert result.exit_code == 1
+    assert 'CREATE_COMPLETE' in result.output
+    assert 'failed' in result.output
+    assert '1/2 failed' in result.output
+
+
+def test_validate_directory_of_stack_files(mock_cloudformation, runner):
+    path = write_stack_files('one', 'two')
+    result = runner.invoke(cli, ['validate', path])
+    assert result.exit_code == 0
+    assert 'stacks/template.json  ok' in result.output
+
+
+def test_validate_stack_file(mock_cloudformation, runner):
+    write_stack_files('one')
+    result = runner.invoke(cli, ['validate', 'stacks/one.yaml'])
+    assert result.exit_code == 0
+    assert 'Parameters' in result.output
+
+
+def test_validate_uses_cache(mock_cloudformation, runner, monkeypatch):
+    with open('template.json', 'w') as fh:
+        fh.write(TEST_TEMPLATE_BODY)
+    result = runner.invoke(cli, ['validate', 'template.json'])
+    assert result.exit_code == 0
+
+    def fail(*args, **kwargs):
+        raise AssertionError('validate_template should not be called')
+
+    monkeypatch.setattr(CfnClient, 'validate_template', fail)
+    cached = runner.invoke(cli, ['validate', 'template.json'])
+    assert cached.exit_code == 0
+    assert cached.output == result.output
+
+    uncached = runner.invoke(cli, ['validate', '--no-cache', 'template.json'])
+    assert uncached.exit_code == 1
+
+
+def test_validate_precheck_before_api(runner, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('validate_template should not be called')
+
+    monkeypatch.setattr(CfnClient, 'validate_template', fail)
+    with open('template.json', 'w') as fh:
+        fh.write('{"Resources": {"A": {"Ref": "Missing"}}}')
+    result = runner.invoke(cli, ['validate', 'template.json'])
+    assert result.exit_code == 1
+    assert 'Unresolved reference: Missing' in result.output
+
+
+def test_create_no_check(runner, monkeypatch):
+    created = []
+    monkeypatch.setattr(CfnClient, 'create_stack',
+                        lambda self, **kwargs: created.append(kwargs) or
+                        {'StackId': 'arn:stack'})
+    with open('template.json', 'w') as fh:
+        fh.write(json.dumps(dict(TEST_TEMPLATE, Extension={})))
+    with open('stack.yaml', 'w') as fh:
+        fh.write(yaml.safe_dump({'name': 'stack', 'template': 'template.json'}))
+
+    result = runner.invoke(cli, ['create', 'stack.yaml'])
+    assert result.exit_code == 1
+    assert 'Unknown top-level section: Extension' in result.output
+    assert created == []
+
+    result = runner.invoke(cli, ['create', '--no-check', 'stack.yaml'])
+    assert result.exit_code == 0, result.output
+    assert created[0]['name'] == 'stack'
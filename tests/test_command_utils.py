@@ -0,0 +1,56 @@
+import threading
+
+from buddy.command.utils import DependencyError, run_parallel
+
+
+def test_run_parallel_results_in_order():
+    results = run_parallel(lambda x: x * 2, [3, 1, 2], workers=2)
+    assert results == [(3, 6, None), (1, 2, None), (2, 4, None)]
+
+
+def test_run_parallel_captures_errors():
+    def fn(x):
+        if x == 2:
+            raise ValueError('two')
+        return x
+
+    results = run_parallel(fn, [1, 2], workers=2)
+    assert results[0] == (1, 1, None)
+    assert isinstance(results[1][2], ValueError)
+
+
+def test_run_parallel_dependency_order():
+    order = []
+    lock = threading.Lock()
+
+    def fn(x):
+        with lock:
+            order.append(x)
+
+    deps = {'app': ['db', 'vpc'], 'db': ['vpc'], 'vpc': []}
+    run_parallel(fn, ['app', 'db', 'vpc'], workers=3,
+                 depends_on=lambda x: deps[x])
+    assert order == ['vpc', 'db', 'app']
+
+
+def test_run_parallel_skips_dependents_of_failures():
+    def fn(x):
+        if x == 'vpc':
+            raise ValueError('boom')
+        return x
+
+    deps = {'app': ['db'], 'db': ['vpc'], 'vpc': [], 'other': []}
+    results = run_parallel(fn, ['app', 'db', 'vpc', 'other'], workers=2,
+                           depends_on=lambda x: deps[x])
+    errors = {item: error for item, _, error in results}
+    assert isinstance(errors['app'], DependencyError)
+    assert isinstance(errors['db'], DependencyError)
+    assert isinstance(errors['vpc'], ValueError)
+    assert errors['other'] is None
+
+
+def test_run_parallel_dependency_cycle():
+    deps = {'a': ['b'], 'b': ['a']}
+    results = run_parallel(lambda x: x, ['a', 'b'], workers=2,
+                           depends_on=lambda x: deps[x])
+    assert all(isinstance(error, DependencyError) for _, _, error in results)
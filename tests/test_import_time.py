@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+HEAVY_MODULES = ['boto3', 'botocore', 'arrow', 'tabulate', 'yaml', 'asyncio']
+
+# Cumulative import time budget of a command module, in milliseconds
+IMPORT_BUDGET_MS = float(os.environ.get('BUDDY_IMPORT_BUDGET_MS', 250))
+
+COMMAND_MODULES = ['buddy.command.stack', 'buddy.command.cluster']
+
+
+def run_python(code, *options):
+    return subprocess.run(
+        [sys.executable] + list(options) + ['-c', code],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True,
+    )
+
+
+def parse_importtime(stderr):
+    """Return {module: cumulative microseconds} from -X importtime."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason='-X importtime')
+@pytest.mark.parametrize('module', COMMAND_MODULES)
+def test_import_time(module):
+    result = run_python('import %s' % module, '-X', 'importtime')
+    times = parse_importtime(result.stderr)
+
+    assert not [m for m in HEAVY_MODULES if m in times]
+    assert times[module] / 1000.0 < IMPORT_BUDGET_MS
+
+
+def loaded_heavy_modules(command, args):
+    code = (
+        'import sys\n'
+        'from buddy.command.%s import cli\n'
+        'try:\n'
+        '    cli(%r)\n'
+        'except SystemExit:\n'
+        '    pass\n'
+        'print(" ".join(m for m in %r if m in sys.modules))\n'
+    ) % (command, args, HEAVY_MODULES)
+    return run_python(code).stdout.splitlines()[-1].split()
+
+
+def test_stack_help_is_light():
+    assert loaded_heavy_modules('stack', ['--help']) == []
+    assert loaded_heavy_modules('stack', ['update', '--help']) == []
+
+
+def test_cluster_dry_run_only_loads_yaml(tmpdir, monkeypatch):
+    config = tmpdir.join('cluster.yaml')
+    config.write(
+        'targets: {prod: {cluster: c, service: s, task: t}}\n'
+        'tasks: {t: {containers: [app]}}\n'
+        'containers: {app: {properties: {memory: 1}}}\n'
+    )
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    args = ['deploy', '--dry-run', str(config), 'prod', 'image', 'rev']
+    assert loaded_heavy_modules('cluster', args) == ['yaml']
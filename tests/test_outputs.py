@@ -0,0 +1,94 @@
+import json
+import os
+
+from buddy.client import CfnClient
+from buddy.command.stack import cli, Stack
+from buddy.outputs import OutputError, OutputIndex
+from conftest import TEST_TEMPLATE
+import pytest
+import yaml
+
+
+NETWORK_TEMPLATE = dict(TEST_TEMPLATE, Outputs={
+    'TopicName': {
+        'Value': {'Fn::GetAtt': ['Sns', 'TopicName']},
+        'Export': {'Name': 'network-topic'},
+    },
+})
+
+APP_TEMPLATE = dict(TEST_TEMPLATE, Parameters={
+    'Topic': {'Type': 'String'},
+    'ExportedTopic': {'Type': 'String'},
+})
+
+
+class CountingClient(CfnClient):
+    def __init__(self):
+        super(CountingClient, self).__init__()
+        self.calls = []
+
+    def describe_stacks(self):
+        self.calls.append('describe_stacks')
+        return super(CountingClient, self).describe_stacks()
+
+    def describe_stack(self, name):
+        self.calls.append('describe_stack')
+        return super(CountingClient, self).describe_stack(name)
+
+    def list_exports(self):
+        self.calls.append('list_exports')
+        return super(CountingClient, self).list_exports()
+
+
+@pytest.fixture
+def network(mock_cloudformation):
+    CfnClient().create_stack('network', json.dumps(NETWORK_TEMPLATE), {}, [])
+
+
+def test_index_is_built_once(network):
+    client = CountingClient()
+    index = OutputIndex(client)
+
+    for _ in range(3):
+        assert index.resolve({'stack': 'network', 'output': 'TopicName'}) \
+            == 'Hello'
+        assert index.resolve({'export': 'network-topic'}) == 'Hello'
+    assert index.resolve(42) == '42'
+    assert client.calls == ['describe_stacks', 'list_exports']
+
+    index.forget('network')
+    index.output('network', 'TopicName')
+    assert client.calls[2:] == ['describe_stack']
+
+
+def test_unknown_references(network):
+    index = OutputIndex(CfnClient())
+    with pytest.raises(OutputError):
+        index.output('network', 'Nope')
+    with pytest.raises(OutputError):
+        index.export('nope')
+    with pytest.raises(OutputError):
+        index.resolve({'stack': 'network'})
+
+
+def test_stack_file_references(network, runner):
+    os.mkdir('stacks')
+    with open('stacks/app.json', 'w') as fh:
+        fh.write(json.dumps(APP_TEMPLATE))
+    with open('stacks/app.yaml', 'w') as fh:
+        fh.write(yaml.safe_dump({
+            'template': 'app.json',
+            'parameters': {
+                'Topic': {'stack': 'network', 'output': 'TopicName'},
+                'ExportedTopic': {'export': 'network-topic'},
+            },
+        }))
+
+    stack = Stack(CfnClient(), 'stacks/app.yaml')
+    assert stack.depends_on == ['network']
+
+    result = runner.invoke(cli, ['create', 'stacks/app.yaml'])
+    assert result.exit_code == 0, result.output
+    parameters = CfnClient().describe_stack('app')['Parameters']
+    assert sorted(p['ParameterValue'] for p in parameters) == [
+        'Hello', 'Hello']
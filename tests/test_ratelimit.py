@@ -0,0 +1,132 @@
+from botocore.exceptions import ClientError
+from buddy.ratelimit import ApiThrottle, RetryBudget, TokenBucket
+import pytest
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_spaces_calls():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=4, burst=1, clock=clock, sleep=clock.sleep)
+    assert [bucket.acquire() for _ in range(3)] == [0, 0.25, 0.25]
+    assert clock.now == 100.5
+
+
+def test_token_bucket_does_not_accumulate_idle_time():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=1, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    clock.now += 10
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0.5
+
+
+def test_token_bucket_burst_then_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock, sleep=clock.sleep)
+    assert [bucket.acquire() for _ in range(4)] == [0, 0, 0.5, 0.5]
+
+
+def test_token_bucket_adapts_to_throttling():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=4, min_rate=1, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        bucket.throttled()
+    assert bucket.rate == 1
+    assert bucket.acquire() == 1
+    for _ in range(20):
+        bucket.succeeded()
+    assert bucket.rate == 4
+
+
+def test_retry_budget():
+    budget = RetryBudget(2, refill=0.5)
+    assert [budget.spend() for _ in range(3)] == [True, True, False]
+    budget.succeeded()
+    budget.succeeded()
+    assert budget.spend()
+
+
+class Response(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def throttling():
+    return Response(400), {'Error': {'Code': 'Throttling', 'Message': ''}}
+
+
+def test_api_throttle_counts_and_budget():
+    clock = FakeClock()
+    throttle = ApiThrottle(default_rate=10, retry_budget=1, clock=clock,
+                           sleep=clock.sleep)
+    event = 'needs-retry.ecs.DescribeServices'
+
+    throttle.before_send(event_name='before-send.ecs.DescribeServices')
+    throttle.needs_retry(event, response=(Response(200), {}))
+    throttle.needs_retry(event, response=throttling())
+    with pytest.raises(ClientError) as info:
+        throttle.needs_retry(event, response=throttling())
+
+    assert info.value.response['Error']['Code'] == 'Throttling'
+    assert throttle.bucket('ecs', 'DescribeServices').rate == 2.5
+    assert throttle.bucket('ecs', 'ListServices').rate == 10
+    assert throttle.counters == {'calls': 1, 'throttles': 2, 'retries': 1,
+                                 'refused': 1, 'waited': 0}
+
+
+class Raw(object):
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+def failing_client(status, body, max_attempts):
+    import boto3
+    import botocore.config
+    from botocore.awsrequest import AWSResponse
+
+    client = boto3.client('ecs', config=botocore.config.Config(
+        retries={'total_max_attempts': max_attempts}))
+    sent = []
+
+    def fail(request, **kwargs):
+        sent.append(request)
+        return AWSResponse(request.url, status, {}, Raw(body))
+
+    client.meta.events.register('before-send.ecs', fail)
+    return client, sent
+
+
+@pytest.mark.parametrize('status, body, throttles', [
+    (500, b'{}', 0),
+    (400, b'{"__type": "ThrottlingException", "message": ""}', 5),
+])
+def test_api_throttle_counts_actual_retries(monkeypatch, status, body,
+                                            throttles):
+    monkeypatch.setattr('botocore.endpoint.time.sleep', lambda delay: None)
+    clock = FakeClock()
+    client, sent = failing_client(status, body, max_attempts=5)
+    throttle = ApiThrottle(default_rate=1000, retry_budget=10, clock=clock,
+                           sleep=clock.sleep)
+    throttle.install(client)
+
+    with pytest.raises(ClientError):
+        client.list_clusters()
+
+    assert len(sent) == 5
+    assert throttle.counters['retries'] == 4
+    assert throttle.counters['throttles'] == throttles
+    assert throttle.counters['refused'] == 0
+    assert throttle.budget.available == 6
@@ -0,0 +1,90 @@
+from buddy.template import check_template, parse_template
+
+
+YAML_TEMPLATE = """
+AWSTemplateFormatVersion: 2010-09-09
+Parameters:
+  Name:
+    Type: String
+  Size:
+    Type: Number
+    Default: 1
+Resources:
+  Topic:
+    Type: AWS::SNS::Topic
+    Properties:
+      TopicName: !Ref Name
+      DisplayName: !Sub '${AWS::StackName}'
+Outputs:
+  Arn:
+    Value: !GetAtt Topic.TopicName
+"""
+
+
+def test_parse_short_form_functions():
+    template = parse_template(YAML_TEMPLATE)
+    topic = template['Resources']['Topic']['Properties']
+    assert topic['TopicName'] == {'Ref': 'Name'}
+    assert template['Outputs']['Arn']['Value'] == {
+        'Fn::GetAtt': ['Topic', 'TopicName']}
+
+
+def test_valid_template():
+    assert check_template(YAML_TEMPLATE) == []
+    assert check_template(YAML_TEMPLATE, {'Name': 'x'}) == []
+
+
+def test_parse_error():
+    problems = check_template('Resources: [')
+    assert len(problems) == 1
+    assert problems[0].startswith('Invalid template')
+
+
+def test_structural_problems():
+    body = YAML_TEMPLATE.replace('Outputs:', 'Output:').replace(
+        '!Ref Name', '!Ref Nmae')
+    assert check_template(body) == [
+        'Unknown top-level section: Output',
+        'Unresolved reference: Nmae',
+    ]
+
+
+def test_hooks_section():
+    body = YAML_TEMPLATE + """
+Hooks:
+  CodeDeployBlueGreenHook:
+    Type: AWS::CodeDeploy::BlueGreen
+"""
+    assert check_template(body, {'Name': 'x'}) == []
+
+
+def test_sam_template():
+    body = """
+Transform: AWS::Serverless-2016-10-31
+Globals:
+  Function:
+    Runtime: python3.12
+Resources:
+  Function:
+    Type: AWS::Serverless::Function
+    Properties:
+      Handler: app.handler
+      Events:
+        Api:
+          Type: Api
+          Properties:
+            RestApiId: !Ref ServerlessRestApi
+"""
+    assert check_template(body) == []
+
+
+def test_parameters_problems():
+    assert check_template(YAML_TEMPLATE, {'Other': 'x'}) == [
+        'Missing parameter: Name',
+        'Unknown parameter: Other',
+    ]
+
+
+def test_missing_resources():
+    assert check_template('{"Description": "empty"}') == [
+        'Missing Resources section']
@@ -0,0 +1,67 @@
+import io
+import json
+
+from buddy import trace
+from buddy.client import EcsClient
+from buddy.waiter import Backoff, Waiter
+import pytest
+
+
+@pytest.fixture
+def tracer():
+    tracer = trace.Tracer(io.StringIO())
+    trace.set_tracer(tracer)
+    yield tracer
+    trace.set_tracer(None)
+
+
+def test_calls_are_traced(mock_ecs, tracer):
+    client = EcsClient()
+    client.boto.create_cluster(clusterName='cluster')
+    with pytest.raises(Exception):
+        client.describe_services('missing', 'service')
+
+    lines = [json.loads(line)
+             for line in tracer.trace_file.getvalue().splitlines()]
+    assert [(line['kind'], line['name'], line['error']) for line in lines] == [
+        ('call', 'ecs.CreateCluster', None),
+        ('call', 'ecs.DescribeServices', 'ClusterNotFoundException'),
+    ]
+    assert lines[0]['bytes'] > 0
+    assert lines[0]['attempts'] == 1
+
+    summary = {row[1]: row for row in tracer.summary()}
+    assert summary['ecs.DescribeServices'][2] == 1
+    assert summary['ecs.DescribeServices'][8] == 1
+
+
+def test_pages_are_traced(mock_ecs, tracer):
+    client = EcsClient()
+    client.boto.list_task_definitions()
+    try:
+        client.boto.list_task_definitions(nextToken='token')
+    except Exception:
+        pass  # Only the request matters
+
+    lines = [json.loads(line)
+             for line in tracer.trace_file.getvalue().splitlines()]
+    assert [line['page'] for line in lines] == [False, True]
+    summary = {row[1]: row for row in tracer.summary()}
+    assert summary['ecs.ListTaskDefinitions'][6] == 1
+
+
+def test_waits_are_traced(tracer):
+    waiter = Waiter(10, Backoff(jitter=0), sleep=lambda delay: None,
+                    name='deploy')
+    polls = iter([None, None, True])
+    waiter.wait(lambda: next(polls))
+
+    line = json.loads(tracer.trace_file.getvalue())
+    assert line['name'] == 'deploy'
+    assert line['attempts'] == 3
+    assert not line['timed_out']
+
+
+def test_no_tracer(mock_ecs):
+    EcsClient().boto.list_clusters()
+    trace.record('wait', 'nothing', 1.0)
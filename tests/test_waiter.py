@@ -0,0 +1,50 @@
+from buddy.waiter import Backoff, Waiter
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_waiter(timeout, backoff):
+    clock = FakeClock()
+    return Waiter(timeout, backoff, clock=clock, sleep=clock.sleep), clock
+
+
+def test_backoff_grows_up_to_maximum():
+    backoff = Backoff(initial=1, factor=2, maximum=5, jitter=0)
+    delays = backoff.delays()
+    assert [next(delays) for _ in range(5)] == [1, 2, 4, 5, 5]
+
+
+def test_backoff_jitter_stays_in_range():
+    delays = Backoff(initial=10, factor=1, jitter=0.2).delays()
+    for _ in range(50):
+        assert 8 <= next(delays) <= 12
+
+
+def test_wait_returns_first_true_result():
+    results = iter([None, False, 'done'])
+    waiter, clock = make_waiter(60, Backoff(initial=1, factor=2, jitter=0))
+
+    assert waiter.wait(lambda: next(results)) == 'done'
+    assert waiter.attempts == 3
+    assert clock.sleeps == [1, 2]
+    assert waiter.elapsed == 3
+
+
+def test_wait_polls_at_deadline_then_times_out():
+    waiter, clock = make_waiter(10, Backoff(initial=4, factor=2, jitter=0))
+
+    assert waiter.wait(lambda: None) is None
+    assert clock.sleeps == [4, 6]
+    assert waiter.attempts == 3
+    assert waiter.elapsed == 10